@@ -5,6 +5,12 @@ import sys
 import logging
 import time
 import re
+import threading
+import hashlib
+from datetime import datetime, timedelta, timezone
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 # Настройка логирования для Railway
 logging.basicConfig(
@@ -16,10 +22,20 @@ logger = logging.getLogger(__name__)
 # Добавляем путь для локальных модулей
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+# Асинхронный клиент Telegram (требует aiohttp); без него доступен только режим потоков
+try:
+    from telebot.async_telebot import AsyncTeleBot
+    ASYNC_AVAILABLE = True
+except ImportError:
+    ASYNC_AVAILABLE = False
+
 # Пытаемся импортировать наши модули
 try:
     import download_schedule
     import schedule_parser
+    import webhook_server
+    import outbound
+    import subscriptions
     LOCAL_MODULES = True
     logger.info("✅ Локальные модули загружены")
 except ImportError as e:
@@ -35,33 +51,525 @@ if not TOKEN:
 
 logger.info(f"✅ Токен получен: {TOKEN[:10]}...")
 
-# Создаем бота
-bot = telebot.TeleBot(TOKEN)
+# Создаем бота. Встроенный пул потоков telebot отключен: обработчики
+# запускаются через собственный пул (см. dispatch_updates), который
+# сохраняет порядок сообщений внутри одного чата.
+bot = telebot.TeleBot(TOKEN, threaded=False)
 
 # ====== КОНСТАНТЫ ======
 ADMIN_IDS = []  # Добавьте сюда ID администраторов через запятую, например: [123456789, 987654321]
 
+# Автообновление расписания с сайта: период и случайный сдвиг в секундах (0 - отключить)
+AUTO_REFRESH_INTERVAL = int(os.getenv('SCHEDULE_REFRESH_INTERVAL', '1800'))
+AUTO_REFRESH_JITTER = int(os.getenv('SCHEDULE_REFRESH_JITTER', '120'))
+
+# Модель выполнения: 'threads' (по умолчанию) или 'async' - сетевые вызовы
+# Telegram выполняются в asyncio, обработчики остаются в пуле потоков
+BOT_RUNTIME = os.getenv('BOT_RUNTIME', 'threads').strip().lower()
+
+# Часовой пояс школы (часы от UTC) - для команд /now, /next, /where
+SCHOOL_UTC_OFFSET = float(os.getenv('SCHOOL_UTC_OFFSET', '10'))
+
+# Количество потоков для обработки сообщений
+BOT_WORKERS = max(1, int(os.getenv('BOT_WORKERS', '8')))
+
+# Режим получения обновлений: 'polling' (по умолчанию) или 'webhook'
+BOT_MODE = os.getenv('BOT_MODE', 'polling').strip().lower()
+
+# Настройки вебхука: публичный адрес, путь, секрет и порт локального сервера
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '').rstrip('/')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_PORT = int(os.getenv('PORT', '8080'))
+
+# Количество потоков, отправляющих исходящие сообщения (в режиме async
+# потоки не нужны: отправка идет задачами цикла событий)
+OUTBOUND_WORKERS = max(1, int(os.getenv('OUTBOUND_WORKERS', '4')))
+
+# Слова, по которым показывается расписание класса на всю неделю ("5А неделя")
+WEEK_WORDS = ('неделя', 'неделю', 'все', 'всё')
+
+# Сколько классов и учителей можно запросить одним сообщением ("5А, 7Б, Иванова")
+MAX_BATCH_QUERIES = 10
+
+# Сколько секунд Telegram может кэшировать ответы встроенного режима у себя
+INLINE_CACHE_TIME = int(os.getenv('INLINE_CACHE_TIME', '300'))
+
+# Сколько готовых ответов хранить в кэше для одной версии расписания
+MAX_RENDERED_MESSAGES = 5000
+
+# Сколько запросов встроенного режима хранить в их собственном кэше
+MAX_INLINE_QUERIES = 1000
+
+# Короткое предупреждение для расписания на один день
+CLASS_DAY_FOOTER = "\n⚠️ Возможны опечатки - уточняйте у классного руководителя"
+
+# Подписи кнопок дней недели
+DAY_BUTTON_LABELS = ('Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб')
+
+CLASS_SCHEDULE_FOOTER = (
+    "\n\n⚠️ *Обратите внимание:*\n"
+    "Расписание может содержать опечатки или изменения.\n"
+    "Актуальную информацию уточняйте у классного руководителя."
+)
+
+TEACHER_SCHEDULE_FOOTER = (
+    "\n\n⚠️ *Внимание:*\n"
+    "1. В оригинальном расписании могут быть *опечатки*\n"
+    "2. Рекомендуем искать учителей по *первым символам* фамилии\n"
+    "3. Бот не несёт ответственности за неточности\n"
+    "4. Проект создан для *образовательных целей*\n\n"
+    "✅ Тестирование показало хорошие результаты работы"
+)
+
+# Кэш готовых ответов: (версия_расписания, {(тип, ключ): текст}).
+# Хранится одной ссылкой - при смене версии заменяется целиком.
+_rendered_cache = (None, {})
+
+# Отдельный кэш результатов встроенного режима: (версия_расписания, {запрос: результаты})
+_inline_cache = (None, {})
+
+# ====== ОБРАБОТКА ОБНОВЛЕНИЙ ======
+
+_worker_pool = ThreadPoolExecutor(max_workers=BOT_WORKERS, thread_name_prefix='bot-worker')
+
+# Очереди необработанных обновлений по чатам. Чат присутствует в словаре,
+# пока его очередь разбирает один из потоков пула.
+_chat_queues = {}
+_chat_queues_lock = threading.Lock()
+
+# Исходный обработчик telebot, вызывается в потоках пула
+_process_updates = bot.process_new_updates
+
+def get_update_chat_id(update):
+    """Ключ, по которому обновления упорядочиваются: чат или пользователь"""
+    message = (update.message or update.edited_message
+               or update.channel_post or update.edited_channel_post)
+    if message is not None:
+        return message.chat.id
+    
+    if update.callback_query is not None:
+        if update.callback_query.message is not None:
+            return update.callback_query.message.chat.id
+        return update.callback_query.from_user.id
+    
+    if update.inline_query is not None:
+        return update.inline_query.from_user.id
+    
+    # Остальные обновления между собой не упорядочиваются
+    return ('update', update.update_id)
+
+def drain_chat_queue(chat_id):
+    """Последовательно обрабатывает обновления одного чата в потоке пула"""
+    while True:
+        with _chat_queues_lock:
+            queue = _chat_queues[chat_id]
+            if not queue:
+                del _chat_queues[chat_id]
+                return
+            update = queue.popleft()
+        
+        try:
+            _process_updates([update])
+        except Exception as e:
+            logger.error(f"❌ Ошибка обработки обновления {update.update_id}: {e}")
+
+def dispatch_updates(updates):
+    """
+    Раскладывает обновления по очередям чатов и отдает их в пул потоков.
+    Сообщения одного чата обрабатываются строго по порядку, а один чат
+    занимает не больше одного потока, поэтому медленный запрос не
+    задерживает остальных пользователей.
+    """
+    for update in updates:
+        # telebot берет offset следующего запроса из last_update_id -
+        # сдвигаем его сразу, не дожидаясь обработки
+        if update.update_id > bot.last_update_id:
+            bot.last_update_id = update.update_id
+        
+        chat_id = get_update_chat_id(update)
+        with _chat_queues_lock:
+            queue = _chat_queues.get(chat_id)
+            if queue is not None:
+                queue.append(update)
+                continue
+            _chat_queues[chat_id] = deque([update])
+        
+        _worker_pool.submit(drain_chat_queue, chat_id)
+
+bot.process_new_updates = dispatch_updates
+
+# ====== ОТПРАВКА СООБЩЕНИЙ ======
+
+# Асинхронный клиент и его цикл событий (заданы только в режиме BOT_RUNTIME=async)
+_async_bot = None
+_async_loop = None
+
+def send_message(chat_id, text, **kwargs):
+    """
+    Отправляет сообщение. Текст длиннее лимита Telegram (4096 символов)
+    уходит несколькими сообщениями: ответ на исходное - первое,
+    клавиатура - у последнего.
+    """
+    chunks = schedule_parser.split_message(text) if LOCAL_MODULES else [text]
+    if len(chunks) == 1:
+        return send_single_message(chat_id, text, **kwargs)
+    
+    reply_markup = kwargs.pop('reply_markup', None)
+    for number, chunk in enumerate(chunks):
+        chunk_kwargs = dict(kwargs)
+        if number > 0:
+            chunk_kwargs.pop('reply_to_message_id', None)
+        if number == len(chunks) - 1 and reply_markup is not None:
+            chunk_kwargs['reply_markup'] = reply_markup
+        send_single_message(chat_id, chunk, **chunk_kwargs)
+
+def send_single_message(chat_id, text, **kwargs):
+    """
+    Отправляет одно сообщение. Когда запущен диспетчер отправки, сообщение
+    ставится в его очередь (с учетом лимитов Telegram) и поток
+    обработчика не ждет ответа сервера.
+    """
+    if LOCAL_MODULES and outbound.is_running():
+        outbound.enqueue(chat_id, text, kwargs)
+        return
+    
+    return bot.send_message(chat_id, text, **kwargs)
+
+def reply_to(message, text, **kwargs):
+    """Отвечает на сообщение пользователя"""
+    return send_message(message.chat.id, text, reply_to_message_id=message.message_id, **kwargs)
+
+def edit_message(chat_id, message_id, text, **kwargs):
+    """Заменяет текст уже отправленного сообщения (через диспетчер отправки)"""
+    if LOCAL_MODULES and outbound.is_running():
+        outbound.enqueue(chat_id, text, dict(kwargs, message_id=message_id), method='edit_message_text')
+        return
+    
+    return bot.edit_message_text(text, chat_id=chat_id, message_id=message_id, **kwargs)
+
+def answer_query(queue_key, method, **params):
+    """
+    Ответ на нажатие кнопки или встроенный запрос (answer_callback_query,
+    answer_inline_query). Идет через диспетчер отправки, как и сообщения,
+    но лимиты сообщений не расходует. queue_key - своя очередь для ответов
+    пользователя, чтобы ответ не ждал сообщений, стоящих в его чате.
+    """
+    if LOCAL_MODULES and outbound.is_running():
+        outbound.enqueue_call(queue_key, method, params, limited=False)
+        return
+    
+    return getattr(bot, method)(**params)
+
+def call_bot_method(method, **params):
+    """Вызов метода Bot API синхронным клиентом из потока диспетчера"""
+    return getattr(bot, method)(**params)
+
+async def call_bot_method_async(method, **params):
+    """Вызов метода Bot API асинхронным клиентом из задачи диспетчера"""
+    return await getattr(_async_bot, method)(**params)
+
+def start_outbound():
+    """
+    Запускает диспетчер отправки для текущей модели выполнения:
+    в режиме async - задачами в цикле событий (вызывается из корутины),
+    иначе - рабочими потоками.
+    """
+    if not LOCAL_MODULES:
+        return
+    
+    if _async_loop is not None:
+        outbound.start_outbound_async(call_bot_method_async)
+    else:
+        outbound.start_outbound(call_bot_method, OUTBOUND_WORKERS)
+
+def handle_webhook_update(data):
+    """Принимает JSON обновления от вебхука и ставит его в очередь чата"""
+    update = types.Update.de_json(data)
+    if update is not None:
+        dispatch_updates([update])
+
 # ====== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ======
 
-def update_schedule_file():
-    """Обновляет файл расписания"""
+# Одновременно может выполняться только одно обновление расписания
+_update_lock = threading.Lock()
+
+def update_schedule_file(conditional=False):
+    """
+    Обновляет файл расписания.
+    Скачивает во временный файл, строит новую модель и только потом
+    подменяет файл и расписание - запросы во время обновления
+    продолжают работать со старыми данными.
+    При conditional=True ничего не перестраивает, если расписание
+    на сайте не изменилось (тогда success = None).
+    """
     if not LOCAL_MODULES:
         return False, "Модули расписания не загружены"
     
+    download_file = schedule_parser.SCHEDULE_FILE + '.download'
+    
     try:
         logger.info("🔄 Начинаю обновление расписания...")
-        download_schedule.download_schedule_from_site()
+        started = time.time()
         
-        import importlib
-        importlib.reload(schedule_parser)
+        downloaded = download_schedule.download_schedule_from_site(download_file, conditional)
+        if downloaded is None:
+            return None, "Расписание на сайте не изменилось"
+        if not downloaded:
+            return False, "Не удалось скачать расписание с сайта"
         
-        if os.path.exists('school_schedule.csv'):
-            file_size = os.path.getsize('school_schedule.csv')
-            return True, f"Расписание обновлено! Размер файла: {file_size} байт"
-        else:
-            return False, "Файл расписания не был создан"
+        # Старая модель нужна, чтобы сообщить подписчикам об изменениях
+        old_state = schedule_parser.get_schedule_state() if schedule_parser.has_schedule_file() else None
+        
+        state = schedule_parser.install_schedule_file(download_file)
+        # Только теперь расписание применено: если сборка или подмена упадет,
+        # следующая условная проверка снова скачает страницу
+        download_schedule.remember_fetch(downloaded)
+        notified = notify_schedule_changes(old_state, state)
+        
+        file_size = os.path.getsize(schedule_parser.SCHEDULE_FILE)
+        return True, (
+            f"Расписание обновлено за {time.time() - started:.1f} с!\n"
+            f"Размер файла: {file_size} байт\n"
+            f"Классов: {len(state['timetable']['classes'])}, "
+            f"учителей: {len(state['teacher_index'])}\n"
+            f"Уведомлено подписчиков: {notified}"
+        )
     except Exception as e:
         return False, f"Ошибка: {str(e)}"
+    finally:
+        if os.path.exists(download_file):
+            os.remove(download_file)
+
+def notify_schedule_changes(old_state, new_state):
+    """
+    Сравнивает старое и новое расписание и отправляет каждому
+    подписанному чату одно сообщение - только с его изменениями.
+    Возвращает количество уведомленных чатов.
+    """
+    if old_state is None or old_state['version'] == new_state['version']:
+        return 0
+    
+    changes = schedule_parser.diff_schedules(old_state, new_state)
+    
+    targets = {}
+    for class_key, class_changes in changes['classes'].items():
+        targets[(subscriptions.KIND_CLASS, class_key)] = class_changes
+    for teacher, teacher_changes in changes['teachers'].items():
+        targets[(subscriptions.KIND_TEACHER, teacher)] = teacher_changes
+    
+    # Обратный индекс подписок: перебираются только изменившиеся цели
+    chat_targets = subscriptions.get_subscribers_for(targets)
+    
+    # Текст изменений одной цели строится один раз для всех её подписчиков
+    sections = {}
+    for chat_id, chat_target_list in chat_targets.items():
+        chat_sections = []
+        for target in chat_target_list:
+            if target not in sections:
+                kind, key = target
+                sections[target] = schedule_parser.format_schedule_changes(
+                    format_subscription(kind, key), targets[target],
+                    show_class=(kind == subscriptions.KIND_TEACHER)
+                )
+            chat_sections.append(sections[target])
+        
+        send_message(
+            chat_id,
+            "🔔 *Расписание изменилось:*\n\n" + '\n\n'.join(chat_sections),
+            parse_mode='Markdown'
+        )
+    
+    logger.info(
+        f"🔔 Изменения: классов {len(changes['classes'])}, учителей {len(changes['teachers'])}, "
+        f"уведомлено чатов: {len(chat_targets)}"
+    )
+    return len(chat_targets)
+
+def resolve_schedule_target(query, state=None):
+    """
+    Определяет, о ком запрос: класс или учитель.
+    state - состояние расписания, уже взятое запросом (по умолчанию текущее).
+    Возвращает (вид, ключ) или None, если ничего однозначно не найдено.
+    """
+    if state is None:
+        state = schedule_parser.get_schedule_state()
+    
+    if schedule_parser.is_class_name(query):
+        class_key = schedule_parser.normalize_class_name(query)
+        if class_key in state['timetable']['class_lessons']:
+            return subscriptions.KIND_CLASS, class_key
+        return None
+    
+    teacher_names = schedule_parser.find_teacher_names(query, state['teacher_search_index'])
+    if len(teacher_names) == 1 or (teacher_names and teacher_names[0].lower() == query.strip().lower()):
+        return subscriptions.KIND_TEACHER, teacher_names[0]
+    
+    return None
+
+def get_school_time():
+    """Текущие день недели (0 - понедельник) и минута суток по времени школы"""
+    now = datetime.now(timezone(timedelta(hours=SCHOOL_UTC_OFFSET)))
+    return now.weekday(), now.hour * 60 + now.minute
+
+def format_subscription(kind, key):
+    """Подписка в виде строки для сообщений"""
+    if kind == subscriptions.KIND_CLASS:
+        return f"📚 Класс {key}"
+    return f"👨‍🏫 {key}"
+
+def run_update_job(chat_id):
+    """Выполняет обновление в фоне и сообщает результат администратору"""
+    try:
+        success, msg = update_schedule_file()
+    finally:
+        _update_lock.release()
+    
+    logger.info(f"{'✅' if success else '❌'} Обновление расписания: {msg}")
+    
+    try:
+        send_message(chat_id, f"{'✅' if success else '❌'} {msg}")
+    except Exception as e:
+        logger.error(f"Не удалось отправить отчет об обновлении: {e}")
+
+def run_auto_refresh():
+    """Один цикл автообновления: скачивает расписание, только если оно изменилось"""
+    # Если сейчас идет ручное обновление, этот цикл пропускаем
+    if not _update_lock.acquire(blocking=False):
+        return
+    
+    try:
+        success, msg = update_schedule_file(conditional=True)
+    finally:
+        _update_lock.release()
+    
+    if success is not None:
+        logger.info(f"{'✅' if success else '❌'} Автообновление расписания: {msg}")
+
+def start_update_job(chat_id):
+    """Запускает фоновое обновление. Возвращает False, если оно уже идет."""
+    if not _update_lock.acquire(blocking=False):
+        return False
+    
+    threading.Thread(
+        target=run_update_job,
+        args=(chat_id,),
+        name='schedule-update',
+        daemon=True
+    ).start()
+    return True
+
+def get_rendered_message(kind, key, render):
+    """
+    Возвращает готовый текст ответа из кэша или строит его через render().
+    Кэш привязан к версии расписания: после обновления он сбрасывается.
+    Если render() вернул None (ничего не найдено), результат не кэшируется.
+    """
+    global _rendered_cache
+    
+    version = schedule_parser.get_schedule_version()
+    cached_version, messages = _rendered_cache
+    if cached_version != version or len(messages) >= MAX_RENDERED_MESSAGES:
+        messages = {}
+        _rendered_cache = (version, messages)
+    
+    text = messages.get((kind, key))
+    if text is None:
+        text = render()
+        if text is not None:
+            messages[(kind, key)] = text
+    
+    return text
+
+def render_class_schedule(class_name):
+    """Текст расписания класса с предупреждением (None, если класс не найден)"""
+    lessons = schedule_parser.get_schedule_for_class(class_name)
+    if lessons is None:
+        return None
+    
+    # Название класса берем из расписания, чтобы ответ не зависел от написания запроса
+    display_name = lessons[0]['class_name'] if lessons else class_name
+    return schedule_parser.format_schedule_for_telegram(display_name, lessons) + CLASS_SCHEDULE_FOOTER
+
+def render_class_day(class_key, weekday):
+    """
+    Расписание класса на один день и клавиатура переключения дней.
+    Возвращает (текст, клавиатура) или None, если класс не найден.
+    """
+    class_info = schedule_parser.get_class_days(class_key)
+    if class_info is None:
+        return None
+    
+    display_name, class_days = class_info
+    day = schedule_parser.DAYS_OF_WEEK[weekday]
+    text = schedule_parser.format_class_day_for_telegram(
+        display_name, day, class_days.get(day, ())
+    ) + CLASS_DAY_FOOTER
+    
+    return text, create_days_keyboard(class_key, class_days, weekday)
+
+def get_default_weekday():
+    """День для расписания без явного дня: сегодня, а в воскресенье - понедельник"""
+    weekday, _ = get_school_time()
+    return weekday if weekday < len(schedule_parser.DAYS_OF_WEEK) else 0
+
+def render_teacher_schedule(teacher_name):
+    """Текст расписания учителя с предупреждением (None, если учитель не найден)"""
+    teacher_info = schedule_parser.get_schedule_by_teacher(teacher_name)
+    if not teacher_info:
+        return None
+    
+    return schedule_parser.format_teacher_schedule(teacher_info) + TEACHER_SCHEDULE_FOOTER
+
+def get_inline_results(query):
+    """
+    Результаты встроенного режима для нормализованного запроса.
+    Кэш у них свой (не вытесняет готовые расписания) и хранит только
+    запросы, для которых в индексе есть варианты: случайный набор букв
+    в кэш не попадает.
+    """
+    global _inline_cache
+    
+    version = schedule_parser.get_schedule_version()
+    cached_version, results_by_query = _inline_cache
+    if cached_version != version or len(results_by_query) >= MAX_INLINE_QUERIES:
+        results_by_query = {}
+        _inline_cache = (version, results_by_query)
+    
+    results = results_by_query.get(query)
+    if results is None:
+        candidates = schedule_parser.get_inline_candidates(query)
+        if not candidates:
+            return []
+        results = results_by_query[query] = build_inline_results(candidates)
+    
+    return results
+
+def build_inline_results(candidates):
+    """Результаты встроенного режима: готовые сообщения с расписанием"""
+    results = []
+    for kind, key, title in candidates:
+        if kind == 'class':
+            text = get_rendered_message('class', key, lambda: render_class_schedule(key))
+            description = "Расписание класса"
+        else:
+            text = get_rendered_message('teacher', key, lambda: render_teacher_schedule(key))
+            description = "Расписание учителя"
+        
+        if text is None:
+            continue
+        
+        results.append(types.InlineQueryResultArticle(
+            id=hashlib.md5(f"{kind}:{key}".encode('utf-8')).hexdigest(),
+            title=title,
+            description=description,
+            # Сообщение не может быть длиннее лимита - берем первую часть
+            input_message_content=types.InputTextMessageContent(
+                schedule_parser.split_message(text)[0], parse_mode='Markdown'
+            )
+        ))
+    
+    return results
 
 def create_main_keyboard():
     """Создает основную клавиатуру с кнопками"""
@@ -71,6 +579,7 @@ def create_main_keyboard():
         "📋 Найти класс",
         "👨‍🏫 Найти учителя",
         "🔄 Обновить",
+        "⭐ Мое расписание",
         "❓ Помощь",
         "ℹ️ О боте"
     ]
@@ -81,6 +590,27 @@ def create_main_keyboard():
     
     return keyboard
 
+def create_days_keyboard(class_key, class_days, current_weekday):
+    """
+    Кнопки дней недели под расписанием класса на день.
+    Нажатие меняет текст того же сообщения (callback 'day:класс:день').
+    """
+    keyboard = types.InlineKeyboardMarkup(row_width=len(DAY_BUTTON_LABELS))
+    
+    buttons = []
+    for weekday, day in enumerate(schedule_parser.DAYS_OF_WEEK):
+        if day not in class_days:
+            continue
+        if weekday == current_weekday:
+            buttons.append(types.InlineKeyboardButton(f"• {DAY_BUTTON_LABELS[weekday]} •", callback_data='day:noop'))
+        else:
+            buttons.append(types.InlineKeyboardButton(
+                DAY_BUTTON_LABELS[weekday], callback_data=f"day:{class_key}:{weekday}"
+            ))
+    
+    keyboard.add(*buttons)
+    return keyboard
+
 def create_classes_keyboard():
     """Создает клавиатуру для поиска класса"""
     keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True)
@@ -115,7 +645,7 @@ def send_welcome(message):
         "💡 *Совет:* Начните с кнопки 'Найти класс' или 'Найти учителя'"
     )
     
-    bot.send_message(
+    send_message(
         message.chat.id,
         welcome_text,
         parse_mode='Markdown',
@@ -126,26 +656,28 @@ def send_welcome(message):
 def update_command(message):
     """Обновление расписания"""
     if message.from_user.id not in ADMIN_IDS and ADMIN_IDS:
-        bot.reply_to(message, "❌ Эта команда доступна только администраторам.")
+        reply_to(message, "❌ Эта команда доступна только администраторам.")
+        return
+    
+    if not start_update_job(message.chat.id):
+        send_message(
+            message.chat.id,
+            "⏳ Обновление уже выполняется. Результат придет отдельным сообщением.",
+            reply_markup=create_back_keyboard()
+        )
         return
     
-    bot.send_message(
+    send_message(
         message.chat.id,
-        "🔄 Обновляю расписание с сайта...",
+        "🔄 Обновляю расписание с сайта...\n"
+        "Бот продолжает работать, результат придет отдельным сообщением.",
         reply_markup=create_back_keyboard()
     )
-    
-    success, msg = update_schedule_file()
-    
-    if success:
-        bot.send_message(message.chat.id, f"✅ {msg}", parse_mode='Markdown')
-    else:
-        bot.send_message(message.chat.id, f"❌ {msg}", parse_mode='Markdown')
 
 @bot.message_handler(commands=['schedule', 'class'])
 def schedule_command(message):
     """Запрос расписания класса"""
-    bot.send_message(
+    send_message(
         message.chat.id,
         "📋 *Введите номер класса:*\n\n"
         "Например: 5А, 10Е, 8 Б\n\n"
@@ -158,7 +690,7 @@ def schedule_command(message):
 def classes_command(message):
     """Список всех классов"""
     if not LOCAL_MODULES:
-        bot.send_message(message.chat.id, "❌ Модули не загружены")
+        send_message(message.chat.id, "❌ Модули не загружены")
         return
     
     try:
@@ -181,20 +713,20 @@ def classes_command(message):
             
             text += f"\n📊 Всего: {len(classes)} классов"
             
-            bot.send_message(message.chat.id, text, parse_mode='Markdown')
+            send_message(message.chat.id, text, parse_mode='Markdown')
         else:
-            bot.send_message(message.chat.id, 
+            send_message(message.chat.id, 
                            "❌ Классы не найдены. Используйте /update", 
                            parse_mode='Markdown')
     except Exception as e:
-        bot.send_message(message.chat.id, f"❌ Ошибка: {str(e)}", parse_mode='Markdown')
+        send_message(message.chat.id, f"❌ Ошибка: {str(e)}", parse_mode='Markdown')
 
 @bot.message_handler(commands=['teacher'])
 def teacher_command(message):
     """Поиск расписания по учителю"""
     args = message.text.split()
     if len(args) < 2:
-        bot.send_message(
+        send_message(
             message.chat.id,
             "👨‍🏫 *Поиск расписания учителя:*\n\n"
             "✏️ *Введите фамилию учителя:*\n"
@@ -215,7 +747,7 @@ def search_teachers_command(message):
     """Поиск учителей по части фамилии"""
     args = message.text.split()
     if len(args) < 2:
-        bot.send_message(
+        send_message(
             message.chat.id,
             "🔍 *Поиск учителей:*\n\n"
             "✏️ *Введите часть фамилии:*\n"
@@ -231,6 +763,240 @@ def search_teachers_command(message):
     search_query = args[1]
     search_teacher_by_partial(message, search_query)
 
+@bot.message_handler(commands=['subscribe'])
+def subscribe_command(message):
+    """Подписка на изменения расписания класса или учителя"""
+    if not LOCAL_MODULES:
+        send_message(message.chat.id, "❌ Модули не загружены")
+        return
+    
+    args = message.text.split(maxsplit=1)
+    if len(args) < 2:
+        current = subscriptions.get_chat_subscriptions(message.chat.id)
+        current_text = (
+            "\n".join(format_subscription(kind, key) for kind, key in current)
+            if current else "пока нет"
+        )
+        send_message(
+            message.chat.id,
+            "🔔 *Уведомления об изменениях расписания:*\n\n"
+            "✏️ Укажите класс или фамилию учителя:\n"
+            "Например: /subscribe 5А или /subscribe Протасова\n\n"
+            f"📋 *Ваши подписки:*\n{current_text}\n\n"
+            "❌ Отписаться: /unsubscribe <класс или фамилия>, /unsubscribe - от всех",
+            parse_mode='Markdown'
+        )
+        return
+    
+    try:
+        target = resolve_schedule_target(args[1].strip())
+        if target is None:
+            send_message(
+                message.chat.id,
+                f"❌ Не найден класс или учитель *{args[1].strip()}*.\n\n"
+                "💡 Уточните название класса или фамилию (/teachers <часть> - поиск учителей)",
+                parse_mode='Markdown'
+            )
+            return
+        
+        if subscriptions.subscribe(message.chat.id, *target):
+            text = f"✅ Вы подписаны: {format_subscription(*target)}\nПришлю изменения после обновления расписания."
+        else:
+            text = f"ℹ️ Вы уже подписаны: {format_subscription(*target)}"
+        send_message(message.chat.id, text)
+        
+    except Exception as e:
+        logger.error(f"Ошибка подписки: {e}")
+        send_message(message.chat.id, f"❌ Ошибка: {str(e)}")
+
+@bot.message_handler(commands=['unsubscribe'])
+def unsubscribe_command(message):
+    """Отмена подписки на изменения расписания"""
+    if not LOCAL_MODULES:
+        send_message(message.chat.id, "❌ Модули не загружены")
+        return
+    
+    args = message.text.split(maxsplit=1)
+    try:
+        if len(args) < 2:
+            removed = subscriptions.unsubscribe(message.chat.id)
+            send_message(message.chat.id, f"✅ Отменено подписок: {removed}")
+            return
+        
+        target = resolve_schedule_target(args[1].strip())
+        if target is None or not subscriptions.unsubscribe(message.chat.id, *target):
+            send_message(message.chat.id, f"ℹ️ Подписки на «{args[1].strip()}» нет")
+            return
+        
+        send_message(message.chat.id, f"✅ Подписка отменена: {format_subscription(*target)}")
+        
+    except Exception as e:
+        logger.error(f"Ошибка отмены подписки: {e}")
+        send_message(message.chat.id, f"❌ Ошибка: {str(e)}")
+
+@bot.message_handler(commands=['my'])
+def my_schedule_command(message):
+    """Расписание по подпискам чата - без ввода класса или фамилии"""
+    if not LOCAL_MODULES:
+        send_message(message.chat.id, "❌ Модули не загружены")
+        return
+    
+    current = subscriptions.get_chat_subscriptions(message.chat.id)
+    if not current:
+        send_message(
+            message.chat.id,
+            "⭐ *Мое расписание:*\n\n"
+            "У вас пока нет подписок.\n"
+            "Подпишитесь на класс или учителя, например:\n"
+            "/subscribe 5А или /subscribe Протасова",
+            parse_mode='Markdown',
+            reply_markup=create_main_keyboard()
+        )
+        return
+    
+    for kind, key in current:
+        if kind == subscriptions.KIND_CLASS:
+            search_class_schedule(message, key)
+        else:
+            search_teacher_schedule(message, key)
+
+@bot.message_handler(commands=['now', 'next', 'where'])
+def lessons_now_command(message):
+    """Что сейчас и что дальше у класса или учителя"""
+    if not LOCAL_MODULES:
+        send_message(message.chat.id, "❌ Модули не загружены")
+        return
+    
+    command = message.text.split()[0].lstrip('/').split('@')[0].lower()
+    args = message.text.split(maxsplit=1)
+    if len(args) < 2:
+        if command == 'where':
+            example = "/where Протасова - где сейчас учитель"
+        else:
+            example = f"/{command} 5А или /{command} Протасова"
+        send_message(
+            message.chat.id,
+            "🕐 *Уроки сейчас:*\n\n"
+            f"✏️ Укажите класс или фамилию учителя:\n{example}",
+            parse_mode='Markdown'
+        )
+        return
+    
+    query = args[1].strip()
+    try:
+        # Одно состояние на весь запрос: обновление расписания посреди него не мешает
+        state = schedule_parser.get_schedule_state()
+        target = resolve_schedule_target(query, state)
+        if target is None or (command == 'where' and target[0] != subscriptions.KIND_TEACHER):
+            send_message(
+                message.chat.id,
+                f"❌ Не найден {'учитель' if command == 'where' else 'класс или учитель'} *{query}*.\n\n"
+                "💡 Уточните запрос (/teachers <часть> - поиск учителей)",
+                parse_mode='Markdown'
+            )
+            return
+        
+        kind, key = target
+        weekday, minute = get_school_time()
+        result = schedule_parser.get_lessons_now(kind, key, weekday, minute, state)
+        if result is None:
+            send_message(message.chat.id, f"❌ Нет расписания для *{key}*.", parse_mode='Markdown')
+            return
+        
+        text = schedule_parser.format_lessons_now(
+            format_subscription(kind, key), result, minute,
+            show_class=(kind == subscriptions.KIND_TEACHER),
+            show_current=(command != 'next')
+        )
+        send_message(message.chat.id, text, parse_mode='Markdown')
+        
+    except Exception as e:
+        logger.error(f"Ошибка запроса /{command} '{query}': {e}")
+        send_message(message.chat.id, f"❌ Ошибка: {str(e)}")
+
+@bot.message_handler(commands=['room'])
+def room_command(message):
+    """Что проходит в кабинете за день"""
+    if not LOCAL_MODULES:
+        send_message(message.chat.id, "❌ Модули не загружены")
+        return
+    
+    args = message.text.split()[1:]
+    if not args:
+        send_message(
+            message.chat.id,
+            "🏫 *Занятость кабинета:*\n\n"
+            "✏️ Укажите номер кабинета и, если нужно, день:\n"
+            "Например: /room 214 или /room 214 вт",
+            parse_mode='Markdown'
+        )
+        return
+    
+    try:
+        weekday, _ = get_school_time()
+        if len(args) > 1:
+            day = schedule_parser.parse_weekday(args[-1], weekday)
+            if day is not None:
+                weekday = day
+                args = args[:-1]
+        
+        query = ' '.join(args)
+        room = schedule_parser.find_room(query)
+        if room is None:
+            send_message(message.chat.id, f"❌ Кабинет *{query}* не найден в расписании", parse_mode='Markdown')
+            return
+        
+        lessons = schedule_parser.get_room_lessons(room, weekday)
+        day_name = schedule_parser.DAYS_OF_WEEK[weekday] if weekday < len(schedule_parser.DAYS_OF_WEEK) else None
+        send_message(
+            message.chat.id,
+            schedule_parser.format_room_lessons(room, day_name, lessons),
+            parse_mode='Markdown'
+        )
+        
+    except Exception as e:
+        logger.error(f"Ошибка запроса /room: {e}")
+        send_message(message.chat.id, f"❌ Ошибка: {str(e)}")
+
+@bot.message_handler(commands=['free'])
+def free_rooms_command(message):
+    """Свободные кабинеты на уроке с данным номером"""
+    if not LOCAL_MODULES:
+        send_message(message.chat.id, "❌ Модули не загружены")
+        return
+    
+    args = message.text.split()[1:]
+    if not args or not args[0].isdigit():
+        send_message(
+            message.chat.id,
+            "🚪 *Свободные кабинеты:*\n\n"
+            "✏️ Укажите номер урока и, если нужно, день:\n"
+            "Например: /free 3 или /free 3 вт",
+            parse_mode='Markdown'
+        )
+        return
+    
+    try:
+        period = int(args[0])
+        weekday, _ = get_school_time()
+        if len(args) > 1:
+            day = schedule_parser.parse_weekday(args[1], weekday)
+            if day is None:
+                send_message(message.chat.id, f"❌ Не понял день: *{args[1]}*", parse_mode='Markdown')
+                return
+            weekday = day
+        
+        result = schedule_parser.get_free_rooms(weekday, period)
+        if result is None:
+            send_message(message.chat.id, f"📭 В этот день нет {period}-го урока")
+            return
+        
+        send_message(message.chat.id, schedule_parser.format_free_rooms(result), parse_mode='Markdown')
+        
+    except Exception as e:
+        logger.error(f"Ошибка запроса /free: {e}")
+        send_message(message.chat.id, f"❌ Ошибка: {str(e)}")
+
 @bot.message_handler(commands=['about', 'info'])
 def about_command(message):
     """Информация о боте"""
@@ -258,7 +1024,7 @@ def about_command(message):
         "По вопросам работы бота обращайтесь к администратору."
     )
     
-    bot.send_message(
+    send_message(
         message.chat.id,
         about_text,
         parse_mode='Markdown',
@@ -269,7 +1035,7 @@ def about_command(message):
 def stats_command(message):
     """Статистика бота"""
     if not LOCAL_MODULES:
-        bot.send_message(message.chat.id, "❌ Модули не загружены")
+        send_message(message.chat.id, "❌ Модули не загружены")
         return
     
     try:
@@ -285,20 +1051,32 @@ def stats_command(message):
             file_size = os.path.getsize('school_schedule.csv')
             file_info = f"Размер файла: {file_size} байт\n"
         
+        subscribed_chats, subscription_count = subscriptions.count_subscriptions()
+        
+        queue_info = ""
+        if outbound.is_running():
+            outbound_stats = outbound.get_outbound_stats()
+            queue_info = (
+                f"📤 *Очередь отправки:* {outbound_stats['queued']} "
+                f"(отправлено: {outbound_stats['sent']}, ограничений Telegram: {outbound_stats['rate_limited']})\n"
+            )
+        
         stats_text = (
             f"📊 *Статистика бота:*\n\n"
             f"📋 *Классы:* {len(classes) if classes else 0}\n"
             f"👨‍🏫 *Учителя:* {len(teacher_index) if teacher_index else 0}\n"
             f"{file_info}"
+            f"🔔 *Подписки:* {subscription_count} (чатов: {subscribed_chats})\n"
+            f"{queue_info}"
             f"🔄 *Последнее обновление:* {time.strftime('%d.%m.%Y %H:%M')}\n\n"
             f"✅ *Статус:* {'Работает нормально' if file_exists else 'Требуется обновление'}\n\n"
             f"💡 Используйте /update для обновления данных"
         )
         
-        bot.send_message(message.chat.id, stats_text, parse_mode='Markdown')
+        send_message(message.chat.id, stats_text, parse_mode='Markdown')
         
     except Exception as e:
-        bot.send_message(message.chat.id, f"❌ Ошибка: {str(e)}", parse_mode='Markdown')
+        send_message(message.chat.id, f"❌ Ошибка: {str(e)}", parse_mode='Markdown')
 
 @bot.message_handler(commands=['manual', 'guide', 'инструкция'])
 def manual_command(message):
@@ -371,7 +1149,7 @@ def manual_command(message):
         "Тестирование показало хорошие результаты работы системы."
     )
     
-    bot.send_message(
+    send_message(
         message.chat.id,
         manual_text,
         parse_mode='Markdown',
@@ -395,6 +1173,11 @@ def handle_update_button(message):
     """Обработка кнопки 'Обновить'"""
     update_command(message)
 
+@bot.message_handler(func=lambda message: message.text == "⭐ Мое расписание")
+def handle_my_schedule_button(message):
+    """Обработка кнопки 'Мое расписание'"""
+    my_schedule_command(message)
+
 @bot.message_handler(func=lambda message: message.text == "❓ Помощь")
 def handle_help_button(message):
     """Обработка кнопки 'Помощь'"""
@@ -430,6 +1213,12 @@ def handle_help_button(message):
         "3. Используйте поиск по части фамилии\n"
         "4. Обратитесь к администратору\n\n"
         
+        "📅 *Расписание на день:* 5А пн, 5А завтра\n"
+        "   Вся неделя: 5А неделя\n\n"
+        
+        "📝 *Несколько сразу:* перечислите через запятую\n"
+        "   Например: 5А, 7Б, Иванова\n\n"
+        
         "💡 *Быстрые команды:*\n"
         "/start - главное меню\n"
         "/help - эта справка\n"
@@ -438,10 +1227,17 @@ def handle_help_button(message):
         "/classes - все классы\n"
         "/teacher <фамилия> - найти учителя\n"
         "/teachers <часть> - поиск учителей\n"
+        "/subscribe <класс или фамилия> - уведомления об изменениях\n"
+        "/my - расписание по подпискам\n"
+        "/now <класс или фамилия> - что идет сейчас\n"
+        "/next <класс или фамилия> - следующий урок\n"
+        "/where <фамилия> - где сейчас учитель\n"
+        "/room <кабинет> [день] - занятость кабинета\n"
+        "/free <номер урока> [день] - свободные кабинеты\n"
         "/manual - полное руководство"
     )
     
-    bot.send_message(
+    send_message(
         message.chat.id,
         help_text,
         parse_mode='Markdown',
@@ -456,12 +1252,77 @@ def handle_about_button(message):
 @bot.message_handler(func=lambda message: message.text == "⬅️ Назад")
 def handle_back_button(message):
     """Обработка кнопки 'Назад'"""
-    bot.send_message(
+    send_message(
         message.chat.id,
         "🔙 Возвращаюсь в главное меню...",
         reply_markup=create_main_keyboard()
     )
 
+# ====== КНОПКИ ДНЕЙ НЕДЕЛИ ======
+
+@bot.callback_query_handler(func=lambda call: call.data and call.data.startswith('day:'))
+def handle_day_callback(call):
+    """Переключение дня: меняет текст того же сообщения вместо отправки нового"""
+    parts = call.data.split(':')
+    
+    try:
+        if len(parts) != 3 or call.message is None or not LOCAL_MODULES:
+            return
+        
+        class_key, weekday = parts[1], int(parts[2])
+        if weekday >= len(schedule_parser.DAYS_OF_WEEK):
+            return
+        
+        rendered = get_rendered_message(
+            'class_day',
+            (class_key, weekday),
+            lambda: render_class_day(class_key, weekday)
+        )
+        if rendered is None:
+            return
+        
+        text, keyboard = rendered
+        edit_message(
+            call.message.chat.id,
+            call.message.message_id,
+            text,
+            parse_mode='Markdown',
+            reply_markup=keyboard
+        )
+    except Exception as e:
+        logger.error(f"Ошибка переключения дня '{call.data}': {e}")
+    finally:
+        # Убираем "часики" на кнопке в любом случае
+        try:
+            answer_query(('callback', call.from_user.id), 'answer_callback_query', callback_query_id=call.id)
+        except Exception as e:
+            logger.error(f"Не удалось ответить на нажатие кнопки: {e}")
+
+# ====== ВСТРОЕННЫЙ РЕЖИМ ======
+
+@bot.inline_handler(func=lambda query: True)
+def handle_inline_query(inline_query):
+    """
+    Запрос вида "@бот 5А" из любого чата.
+    Ответ одинаков для всех пользователей (is_personal=False), поэтому
+    Telegram сам отдает его из своего кэша на повторные запросы.
+    """
+    if not LOCAL_MODULES or not schedule_parser.has_schedule_file():
+        return
+    
+    try:
+        query = schedule_parser.normalize_inline_query(inline_query.query)
+        answer_query(
+            ('inline', inline_query.from_user.id),
+            'answer_inline_query',
+            inline_query_id=inline_query.id,
+            results=get_inline_results(query),
+            cache_time=INLINE_CACHE_TIME,
+            is_personal=False
+        )
+    except Exception as e:
+        logger.error(f"Ошибка встроенного запроса '{inline_query.query}': {e}")
+
 # ====== ОБРАБОТЧИКИ ТЕКСТА ======
 
 @bot.message_handler(func=lambda message: True)
@@ -470,11 +1331,11 @@ def handle_text(message):
     user_input = message.text.strip()
     
     if not LOCAL_MODULES:
-        bot.send_message(message.chat.id, "❌ Модули не загружены")
+        send_message(message.chat.id, "❌ Модули не загружены")
         return
     
     if not schedule_parser.has_schedule_file():
-        bot.send_message(
+        send_message(
             message.chat.id,
             "❌ *Файл расписания не найден!*\n\n"
             "📥 Используйте команду /update чтобы скачать актуальное расписание.",
@@ -484,8 +1345,22 @@ def handle_text(message):
         return
     
     try:
+        # Несколько запросов через запятую - один общий ответ
+        queries = [query for query in re.split(r'[,;\n]', user_input) if query.strip()]
+        class_name, day_word = split_class_and_day(user_input)
+        if len(queries) > 1:
+            search_multiple_schedules(message, queries)
+        # Класс и день: "5А пн", "5А завтра", "5А неделя"
+        elif class_name is not None:
+            if day_word in WEEK_WORDS:
+                search_class_week(message, class_name)
+            else:
+                weekday = schedule_parser.parse_weekday(day_word, get_school_time()[0])
+                if weekday is None or weekday >= len(schedule_parser.DAYS_OF_WEEK):
+                    weekday = get_default_weekday()
+                search_class_schedule(message, class_name, weekday)
         # Проверяем, является ли ввод классом (цифра + буква)
-        if re.match(r'^\d+\s*[А-Яа-яA-Za-z]$', user_input, re.IGNORECASE):
+        elif schedule_parser.is_class_name(user_input):
             # Это класс
             search_class_schedule(message, user_input)
         else:
@@ -494,7 +1369,7 @@ def handle_text(message):
             
     except Exception as e:
         logger.error(f"Ошибка обработки запроса '{user_input}': {e}")
-        bot.send_message(
+        send_message(
             message.chat.id,
             f"❌ *Ошибка при обработке запроса:* {str(e)}\n\n"
             "💡 *Попробуйте:*\n"
@@ -507,35 +1382,103 @@ def handle_text(message):
 
 # ====== ФУНКЦИИ ПОИСКА ======
 
-def search_class_schedule(message, class_name):
-    """Поиск расписания для класса"""
+def search_multiple_schedules(message, queries):
+    """Расписания нескольких классов и учителей одним ответом"""
     try:
-        lessons = schedule_parser.get_schedule_for_class(class_name)
+        results = schedule_parser.get_schedules_batch(queries[:MAX_BATCH_QUERIES])
+        message_text = schedule_parser.format_schedules_batch(results)
         
-        if lessons is None:
-            bot.send_message(
-                message.chat.id,
-                f"❌ Класс *{class_name}* не найден.\n\n"
-                "💡 *Попробуйте:*\n"
-                "• Другой формат (5А, 5 А, 5а)\n"
-                "• Команду /classes для списка всех классов\n"
-                "• Обновить расписание /update",
-                parse_mode='Markdown',
-                reply_markup=create_classes_keyboard()
-            )
+        if len(queries) > MAX_BATCH_QUERIES:
+            message_text += f"\n\n⚠️ Показаны первые {MAX_BATCH_QUERIES} запросов из {len(queries)}"
+        
+        send_message(
+            message.chat.id,
+            message_text + CLASS_SCHEDULE_FOOTER,
+            parse_mode='Markdown',
+            reply_markup=create_main_keyboard()
+        )
+        
+    except Exception as e:
+        logger.error(f"Ошибка поиска по нескольким запросам {queries}: {e}")
+        send_message(
+            message.chat.id,
+            f"❌ *Ошибка при поиске:* {str(e)}",
+            parse_mode='Markdown',
+            reply_markup=create_main_keyboard()
+        )
+
+def split_class_and_day(user_input):
+    """
+    Разбирает запрос "5А пн" / "5 А завтра" / "5А неделя".
+    Возвращает (класс, слово_дня) или (None, None), если это не такой запрос.
+    """
+    parts = user_input.rsplit(maxsplit=1)
+    if len(parts) != 2 or not schedule_parser.is_class_name(parts[0]):
+        return None, None
+    
+    day_word = parts[1].lower()
+    if day_word in WEEK_WORDS or schedule_parser.parse_weekday(day_word, 0) is not None:
+        return parts[0], day_word
+    
+    return None, None
+
+def search_class_schedule(message, class_name, weekday=None):
+    """Расписание класса на один день (по умолчанию - сегодня) с кнопками дней"""
+    if weekday is None:
+        weekday = get_default_weekday()
+    
+    try:
+        class_key = schedule_parser.normalize_class_name(class_name)
+        rendered = get_rendered_message(
+            'class_day',
+            (class_key, weekday),
+            lambda: render_class_day(class_key, weekday)
+        )
+        
+        if rendered is None:
+            send_class_not_found(message, class_name)
             return
         
-        # Форматируем расписание
-        message_text = schedule_parser.format_schedule_for_telegram(class_name, lessons)
+        text, keyboard = rendered
+        send_message(message.chat.id, text, parse_mode='Markdown', reply_markup=keyboard)
         
-        # Добавляем предупреждение
-        message_text += (
-            "\n\n⚠️ *Обратите внимание:*\n"
-            "Расписание может содержать опечатки или изменения.\n"
-            "Актуальную информацию уточняйте у классного руководителя."
+    except Exception as e:
+        logger.error(f"Ошибка поиска класса {class_name}: {e}")
+        send_message(
+            message.chat.id,
+            f"❌ *Ошибка при поиске класса:* {str(e)}\n"
+            "Попробуйте обновить расписание командой /update",
+            parse_mode='Markdown',
+            reply_markup=create_main_keyboard()
         )
+
+def send_class_not_found(message, class_name):
+    """Сообщение о том, что класс не найден"""
+    send_message(
+        message.chat.id,
+        f"❌ Класс *{class_name}* не найден.\n\n"
+        "💡 *Попробуйте:*\n"
+        "• Другой формат (5А, 5 А, 5а)\n"
+        "• Команду /classes для списка всех классов\n"
+        "• Обновить расписание /update",
+        parse_mode='Markdown',
+        reply_markup=create_classes_keyboard()
+    )
+
+def search_class_week(message, class_name):
+    """Поиск расписания для класса на всю неделю"""
+    try:
+        message_text = get_rendered_message(
+            'class',
+            schedule_parser.normalize_class_name(class_name),
+            lambda: render_class_schedule(class_name)
+        )
+        
+        if message_text is None:
+            send_class_not_found(message, class_name)
+            return
         
-        bot.send_message(
+        send_message(
             message.chat.id,
             message_text,
             parse_mode='Markdown',
@@ -544,7 +1487,7 @@ def search_class_schedule(message, class_name):
         
     except Exception as e:
         logger.error(f"Ошибка поиска класса {class_name}: {e}")
-        bot.send_message(
+        send_message(
             message.chat.id,
             f"❌ *Ошибка при поиске класса:* {str(e)}\n"
             "Попробуйте обновить расписание командой /update",
@@ -555,11 +1498,15 @@ def search_class_schedule(message, class_name):
 def search_teacher_schedule(message, teacher_name):
     """Поиск расписания для учителя"""
     try:
-        teacher_info = schedule_parser.get_schedule_by_teacher(teacher_name)
+        response_text = get_rendered_message(
+            'teacher',
+            teacher_name.strip(),
+            lambda: render_teacher_schedule(teacher_name)
+        )
         
-        if not teacher_info:
+        if response_text is None:
             # Предлагаем поиск по части фамилии
-            bot.send_message(
+            send_message(
                 message.chat.id,
                 f"❌ Учитель *{teacher_name}* не найден.\n\n"
                 "💡 *Рекомендации:*\n"
@@ -574,20 +1521,7 @@ def search_teacher_schedule(message, teacher_name):
             )
             return
         
-        # Форматируем расписание
-        response_text = schedule_parser.format_teacher_schedule(teacher_info)
-        
-        # Добавляем важное предупреждение
-        response_text += (
-            "\n\n⚠️ *Внимание:*\n"
-            "1. В оригинальном расписании могут быть *опечатки*\n"
-            "2. Рекомендуем искать учителей по *первым символам* фамилии\n"
-            "3. Бот не несёт ответственности за неточности\n"
-            "4. Проект создан для *образовательных целей*\n\n"
-            "✅ Тестирование показало хорошие результаты работы"
-        )
-        
-        bot.send_message(
+        send_message(
             message.chat.id,
             response_text,
             parse_mode='Markdown',
@@ -596,7 +1530,7 @@ def search_teacher_schedule(message, teacher_name):
         
     except Exception as e:
         logger.error(f"Ошибка поиска учителя {teacher_name}: {e}")
-        bot.send_message(
+        send_message(
             message.chat.id,
             f"❌ *Ошибка при поиске учителя:* {str(e)}\n\n"
             "💡 *Совет:* Попробуйте поиск по части фамилии: /teachers {первые_буквы}",
@@ -620,7 +1554,7 @@ def search_teacher_by_partial(message, search_query):
             "🎓 *Бот создан для образовательных целей*"
         )
         
-        bot.send_message(
+        send_message(
             message.chat.id,
             response_text,
             parse_mode='Markdown',
@@ -629,7 +1563,7 @@ def search_teacher_by_partial(message, search_query):
         
     except Exception as e:
         logger.error(f"Ошибка поиска учителей {search_query}: {e}")
-        bot.send_message(
+        send_message(
             message.chat.id,
             f"❌ Ошибка: {str(e)}",
             parse_mode='Markdown',
@@ -658,16 +1592,116 @@ def main():
         else:
             logger.info("📭 Файл расписания не найден")
             logger.info("ℹ️  Используйте /update в боте для загрузки")
+        
+        if AUTO_REFRESH_INTERVAL > 0:
+            download_schedule.start_auto_refresh(run_auto_refresh, AUTO_REFRESH_INTERVAL, AUTO_REFRESH_JITTER)
+    
+    if BOT_RUNTIME == 'async':
+        run_async()
+        return
+    
+    start_outbound()
+    if BOT_MODE == 'webhook':
+        run_webhook()
+    else:
+        run_polling()
+
+def run_webhook():
+    """Получение обновлений через вебхук и встроенный HTTP-сервер"""
+    if not LOCAL_MODULES:
+        logger.error("❌ Режим webhook недоступен без локальных модулей")
+        sys.exit(1)
+    
+    if not WEBHOOK_URL:
+        logger.error("❌ Для режима webhook укажите переменную WEBHOOK_URL")
+        sys.exit(1)
+    
+    webhook_server.start_webhook_server(
+        WEBHOOK_PORT, WEBHOOK_PATH, handle_webhook_update, WEBHOOK_SECRET or None
+    )
     
+    # Регистрируем вебхук в Telegram, повторяя попытки при ошибках сети
+    while True:
+        try:
+            bot.set_webhook(url=WEBHOOK_URL + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET or None)
+            logger.info(f"✅ Вебхук установлен: {WEBHOOK_URL}{WEBHOOK_PATH} ({BOT_WORKERS} потоков обработки)")
+            break
+        except Exception as e:
+            logger.error(f"❌ Ошибка установки вебхука: {e}")
+            logger.info("⏳ Повтор через 10 секунд...")
+            time.sleep(10)
+    
+    # Сервер работает в фоновом потоке, основной поток просто ждет
+    threading.Event().wait()
+
+def run_polling():
+    """Получение обновлений через long polling"""
     # Запускаем бота с перезапуском при ошибках
     while True:
         try:
-            logger.info("🔄 Запуск polling...")
+            # Если раньше бот работал через вебхук, getUpdates будет отклонен
+            bot.remove_webhook()
+            logger.info(f"🔄 Запуск polling ({BOT_WORKERS} потоков обработки)...")
             bot.polling(none_stop=True, interval=2, timeout=30)
         except Exception as e:
             logger.error(f"❌ Ошибка polling: {e}")
             logger.info("⏳ Перезапуск через 10 секунд...")
             time.sleep(10)
 
+def run_async():
+    """Запуск в асинхронном режиме (BOT_RUNTIME=async)"""
+    if not ASYNC_AVAILABLE:
+        logger.error("❌ Для BOT_RUNTIME=async установите aiohttp")
+        sys.exit(1)
+    
+    if BOT_MODE == 'webhook' and not (LOCAL_MODULES and WEBHOOK_URL):
+        logger.error("❌ Для режима webhook укажите переменную WEBHOOK_URL")
+        sys.exit(1)
+    
+    asyncio.run(serve_async())
+
+async def serve_async():
+    """
+    Получение обновлений и отправка ответов через AsyncTeleBot.
+    Обработчики (разбор расписания, поиск) по-прежнему выполняются в пуле
+    потоков с порядком по чатам, а сетевые вызовы не занимают потоки.
+    """
+    global _async_bot, _async_loop
+    
+    _async_bot = AsyncTeleBot(TOKEN)
+    _async_loop = asyncio.get_running_loop()
+    
+    async def process_updates(updates):
+        dispatch_updates(updates)
+    
+    _async_bot.process_new_updates = process_updates
+    start_outbound()
+    
+    try:
+        if BOT_MODE == 'webhook':
+            webhook_server.start_webhook_server(
+                WEBHOOK_PORT, WEBHOOK_PATH, handle_webhook_update, WEBHOOK_SECRET or None
+            )
+            
+            while True:
+                try:
+                    await _async_bot.set_webhook(url=WEBHOOK_URL + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET or None)
+                    logger.info(f"✅ Вебхук установлен (async): {WEBHOOK_URL}{WEBHOOK_PATH}")
+                    break
+                except Exception as e:
+                    logger.error(f"❌ Ошибка установки вебхука: {e}")
+                    logger.info("⏳ Повтор через 10 секунд...")
+                    await asyncio.sleep(10)
+            
+            await asyncio.Event().wait()
+        else:
+            await _async_bot.remove_webhook()
+            logger.info(f"🔄 Запуск polling (async, {BOT_WORKERS} потоков обработки)...")
+            await _async_bot.infinity_polling(timeout=30)
+    finally:
+        _async_loop = None
+        await _async_bot.close_session()
+
+
 if __name__ == '__main__':
     main()
\ No newline at end of file
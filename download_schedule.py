@@ -1,41 +1,346 @@
 import requests
 from bs4 import BeautifulSoup
+import os
+import sys
 import csv
+import time
+import hashlib
 import logging
+import random
+import threading
+import tracemalloc
 
 logger = logging.getLogger(__name__)
 
-def download_schedule_from_site():
-    """Скачивает расписание с сайта и сохраняет в CSV"""
+# Потоковый разбор через lxml; без него используется BeautifulSoup
+try:
+    from lxml import etree
+    LXML_AVAILABLE = True
+except ImportError:
+    LXML_AVAILABLE = False
+
+SCHEDULE_ENCODING = 'windows-1251'
+
+BASE_URL = "http://www.dnevnik25.ru/"
+SCHEDULE_URL = BASE_URL + "расписание.files/sheet001.htm"
+
+# Валидаторы последней успешной загрузки - для условных запросов
+_last_fetch = {
+    'etag': None,
+    'last_modified': None,
+    'content_hash': None
+}
+
+# Размер куска, которым дочитывается остаток страницы после таблицы
+READ_CHUNK_SIZE = 64 * 1024
+
+class HashingReader:
+    """
+    Поток байт страницы, который по пути считает их sha1.
+    Разборщик читает из него напрямую, поэтому страница целиком
+    в памяти не собирается.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.hash = hashlib.sha1()
+    
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.hash.update(data)
+        return data
+    
+    def hexdigest(self):
+        """Хэш всей страницы: непрочитанный остаток дочитывается кусками."""
+        while self.read(READ_CHUNK_SIZE):
+            pass
+        return self.hash.hexdigest()
+
+def fetch_schedule_page(conditional=False):
+    """
+    Начинает скачивание страницы расписания (тело читается потоком).
+    При conditional=True отправляет If-None-Match / If-Modified-Since.
+    Возвращает response или None, если страница не изменилась (ответ 304).
+    """
+    headers = {}
+    if conditional:
+        if _last_fetch['etag']:
+            headers['If-None-Match'] = _last_fetch['etag']
+        if _last_fetch['last_modified']:
+            headers['If-Modified-Since'] = _last_fetch['last_modified']
     
-    base_url = "http://www.dnevnik25.ru/"
-    schedule_url = base_url + "расписание.files/sheet001.htm"
+    response = requests.get(SCHEDULE_URL, headers=headers, timeout=30, stream=True)
     
-    logger.info(f"🌐 Скачиваю расписание с: {schedule_url}")
+    if response.status_code == 304:
+        response.close()
+        logger.info("📭 Расписание на сайте не изменилось (304)")
+        return None
     
     try:
-        response = requests.get(schedule_url, timeout=30)
-        response.encoding = 'windows-1251'
-        
-        soup = BeautifulSoup(response.text, 'html.parser')
-        table = soup.find('table')
+        response.raise_for_status()
+    except Exception:
+        response.close()
+        raise
+    
+    # Сайт может отдать страницу в gzip - распаковываем на лету
+    response.raw.decode_content = True
+    return response
+
+def get_cell_text(cell):
+    """Текст ячейки lxml - как get_text(strip=True, separator=' ') в BeautifulSoup."""
+    return ' '.join(part.strip() for part in cell.itertext() if part.strip())
+
+def get_cell_span(cell, attribute):
+    """Значение colspan/rowspan ячейки (1, если не задано или некорректно)."""
+    try:
+        return max(1, int(cell.get(attribute) or 1))
+    except ValueError:
+        return 1
+
+def iter_table_rows_lxml(source):
+    """
+    Потоково разбирает HTML (файл или поток байт) и выдает строки
+    первой таблицы как списки ячеек (текст, colspan, rowspan).
+    В памяти держится только текущая строка: разобранные элементы сразу удаляются.
+    """
+    table_depth = 0
+    table_seen = False
+    
+    for event, element in etree.iterparse(source, events=('start', 'end'), tag=('table', 'tr'),
+                                          html=True, encoding=SCHEDULE_ENCODING):
+        if element.tag == 'table':
+            if event == 'start':
+                # Берем только первую таблицу (как soup.find('table'))
+                if table_seen and table_depth == 0:
+                    return
+                table_depth += 1
+                table_seen = True
+            else:
+                table_depth -= 1
+                if table_depth == 0:
+                    return
+            continue
         
-        if not table:
-            logger.error("❌ Таблица не найдена")
-            return
+        if event == 'end' and table_depth:
+            yield [
+                (get_cell_text(cell), get_cell_span(cell, 'colspan'), get_cell_span(cell, 'rowspan'))
+                for cell in element if cell.tag in ('td', 'th')
+            ]
+            
+            # Освобождаем разобранную строку и все предыдущие
+            element.clear()
+            parent = element.getparent()
+            while element.getprevious() is not None:
+                del parent[0]
+
+def iter_table_rows_bs4(html_text):
+    """Строки первой таблицы через BeautifulSoup (строит все дерево в памяти)."""
+    soup = BeautifulSoup(html_text, 'html.parser')
+    table = soup.find('table')
+    
+    if not table:
+        return
+    
+    for row in table.find_all('tr'):
+        cells = row.find_all(['td', 'th'])
+        yield [
+            (cell.get_text(strip=True, separator=' '), get_cell_span(cell, 'colspan'), get_cell_span(cell, 'rowspan'))
+            for cell in cells
+        ]
+
+def expand_table_spans(rows):
+    """
+    Разворачивает colspan/rowspan в честную двумерную сетку:
+    каждая ячейка стоит в своем столбце листа Excel, поэтому номер
+    столбца класса одинаков во всех строках блока.
+    Текст объединенной ячейки остается только в ее левой верхней клетке,
+    остальные клетки области пустые - строка со временем урока
+    по-прежнему одна на урок.
+    Принимает и выдает строки по одной.
+    """
+    # Столбец -> сколько еще строк он занят ячейкой с rowspan сверху
+    pending_rowspans = {}
+    
+    for row in rows:
+        grid_row = []
+        column = 0
         
-        with open('school_schedule.csv', 'w', encoding='utf-8', newline='') as csvfile:
-            writer = csv.writer(csvfile)
-            rows = table.find_all('tr')
+        for text, colspan, rowspan in row:
+            # Пропускаем столбцы, занятые объединенными ячейками из строк выше
+            while pending_rowspans.get(column):
+                grid_row.append('')
+                column += 1
+            
+            grid_row.append(text)
+            grid_row.extend([''] * (colspan - 1))
             
-            for row in rows:
-                cells = row.find_all(['td', 'th'])
-                row_data = [cell.get_text(strip=True, separator=' ') for cell in cells]
-                if row_data:
-                    writer.writerow(row_data)
+            if rowspan > 1:
+                for span_column in range(column, column + colspan):
+                    pending_rowspans[span_column] = rowspan
             
-            logger.info(f"✅ Сохранено {len(rows)} строк")
+            column += colspan
+        
+        # Объединенные ячейки сверху могут занимать и столбцы правее последней ячейки
+        occupied = [col for col, remaining in pending_rowspans.items() if remaining and col >= len(grid_row)]
+        if occupied:
+            grid_row.extend([''] * (max(occupied) + 1 - len(grid_row)))
+        
+        # Каждая строка уменьшает остаток у всех занятых столбцов, кроме только что начатых
+        for span_column in list(pending_rowspans):
+            if pending_rowspans[span_column]:
+                pending_rowspans[span_column] -= 1
+        
+        yield grid_row
+
+def iter_table_rows(stream):
+    """
+    Строки первой таблицы из потока байт страницы - самым быстрым доступным
+    способом, с развернутыми объединенными ячейками.
+    """
+    if LXML_AVAILABLE:
+        rows = iter_table_rows_lxml(stream)
+    else:
+        rows = iter_table_rows_bs4(stream.read().decode(SCHEDULE_ENCODING, errors='replace'))
+    return expand_table_spans(rows)
+
+def write_schedule_csv(rows, output_file):
+    """
+    Записывает строки таблицы в CSV по мере поступления.
+    Возвращает (число_строк_таблицы, число_записанных_строк).
+    """
+    row_count = 0
+    written_count = 0
+    
+    with open(output_file, 'w', encoding='utf-8', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        
+        for row_data in rows:
+            row_count += 1
+            if row_data:
+                writer.writerow(row_data)
+                written_count += 1
+    
+    return row_count, written_count
+
+def download_schedule_from_site(output_file='school_schedule.csv', conditional=False):
+    """
+    Скачивает расписание с сайта и сохраняет в CSV.
+    Возвращает валидаторы загрузки (словарь для remember_fetch), если
+    таблица найдена и файл записан, None - если при conditional=True
+    расписание не изменилось, False - при ошибке.
+    Валидаторы не запоминаются здесь: вызывающий передает их в
+    remember_fetch, только когда новое расписание действительно применено.
+    """
+    
+    logger.info(f"🌐 Скачиваю расписание с: {SCHEDULE_URL}")
+    
+    try:
+        response = fetch_schedule_page(conditional)
+        if response is None:
+            return None
+        
+        # Страница разбирается прямо из сокета, хэш считается по ходу чтения
+        with response:
+            reader = HashingReader(response.raw)
+            row_count, written_count = write_schedule_csv(iter_table_rows(reader), output_file)
+            content_hash = reader.hexdigest()
+        
+        if conditional and content_hash == _last_fetch['content_hash']:
+            logger.info("📭 Расписание на сайте не изменилось (то же содержимое)")
+            return None
+        
+        if not written_count:
+            logger.error("❌ Таблица не найдена")
+            return False
+        
+        logger.info(f"✅ Сохранено {row_count} строк")
+        
+        return {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'content_hash': content_hash
+        }
             
     except Exception as e:
         logger.error(f"❌ Ошибка: {e}")
-        
\ No newline at end of file
+        return False
+
+def remember_fetch(validators):
+    """
+    Запоминает валидаторы загрузки для следующих условных запросов.
+    Пока они не запомнены, условная загрузка скачивает страницу заново.
+    """
+    _last_fetch.update(validators)
+
+def start_auto_refresh(refresh_job, interval, jitter=0):
+    """
+    Запускает фоновый поток, который вызывает refresh_job()
+    каждые interval секунд (± случайный сдвиг до jitter секунд,
+    чтобы не стучаться на сайт строго по расписанию).
+    Возвращает threading.Event - его установка останавливает поток.
+    """
+    stop_event = threading.Event()
+    
+    def refresh_loop():
+        while True:
+            delay = max(1, interval + random.uniform(-jitter, jitter))
+            if stop_event.wait(delay):
+                break
+            try:
+                refresh_job()
+            except Exception as e:
+                logger.error(f"❌ Ошибка автообновления расписания: {e}")
+    
+    threading.Thread(target=refresh_loop, name='schedule-auto-refresh', daemon=True).start()
+    logger.info(f"⏰ Автообновление расписания каждые {interval} с (±{jitter} с)")
+    
+    return stop_event
+
+def benchmark_extractors(html_file, repeat=3):
+    """
+    Сравнивает потоковый разбор lxml с BeautifulSoup на сохраненной странице:
+    время, пиковая память и совпадение результата.
+    Оба способа читают файл сами, как при загрузке с сайта, поэтому
+    в пик памяти входит и буфер страницы, если способу он нужен.
+    """
+    def read_bs4():
+        with open(html_file, 'rb') as f:
+            yield from expand_table_spans(iter_table_rows_bs4(f.read().decode(SCHEDULE_ENCODING, errors='replace')))
+    
+    def read_lxml():
+        with open(html_file, 'rb') as f:
+            yield from expand_table_spans(iter_table_rows_lxml(f))
+    
+    extractors = [('BeautifulSoup', read_bs4)]
+    if LXML_AVAILABLE:
+        extractors.append(('lxml iterparse', read_lxml))
+    
+    print(f"📄 {html_file}: {os.path.getsize(html_file)} байт")
+    
+    results = {}
+    for name, extractor in extractors:
+        best_time = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            rows = [row for row in extractor() if row]
+            elapsed = time.perf_counter() - started
+            best_time = elapsed if best_time is None else min(best_time, elapsed)
+        
+        tracemalloc.start()
+        for _ in extractor():
+            pass
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        
+        results[name] = rows
+        print(f"{name:>15}: {best_time * 1000:8.1f} мс, пик памяти {peak_memory / 1024:8.0f} КБ, строк {len(rows)}")
+    
+    outputs = list(results.values())
+    print("✅ Результаты совпадают" if all(rows == outputs[0] for rows in outputs) else "❌ Результаты различаются")
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    
+    if len(sys.argv) == 3 and sys.argv[1] == '--benchmark':
+        benchmark_extractors(sys.argv[2])
+    else:
+        download_schedule_from_site()
\ No newline at end of file
@@ -0,0 +1,346 @@
+import time
+import heapq
+import asyncio
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Общий лимит Telegram на отправку сообщений ботом (сообщений в секунду)
+GLOBAL_RATE = 30
+GLOBAL_BURST = 30
+
+# Лимиты для одного чата: личные чаты - около 1 сообщения в секунду
+# с небольшим запасом, группы - не больше 20 сообщений в минуту
+CHAT_RATE = 1.0
+CHAT_BURST = 3
+GROUP_RATE = 20 / 60
+GROUP_BURST = 3
+
+# Сколько сообщений может ждать отправки в одном чате
+MAX_CHAT_QUEUE = 30
+
+# Повторы при сетевых ошибках (429 повторяется всегда, по retry_after)
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 2
+
+# Состояние диспетчера. Все поля меняются только под _condition.
+_condition = threading.Condition()
+_send = None
+_chat_queues = {}      # chat_id -> deque сообщений, ожидающих отправки
+_chat_buckets = {}     # chat_id -> ведро токенов чата
+_chat_ready = {}       # chat_id -> время, раньше которого в чат не отправляем
+_ready_heap = []       # (время, порядковый номер, chat_id) для чатов с очередью
+_in_flight = set()     # чаты, сообщение в которые отправляется прямо сейчас
+_global_bucket = None
+_sequence = 0
+_loop = None           # цикл событий асинхронного режима (None - режим потоков)
+_chat_tasks = {}       # chat_id -> задача цикла событий, отправляющая сообщения чата
+_stats = {'sent': 0, 'coalesced': 0, 'dropped': 0, 'rate_limited': 0, 'failed': 0}
+
+def create_bucket(rate, burst, now=None):
+    """Ведро токенов: rate - пополнение в секунду, burst - емкость"""
+    return {'rate': rate, 'burst': burst, 'tokens': float(burst),
+            'updated': time.monotonic() if now is None else now}
+
+def refill_bucket(bucket, now):
+    """Пополняет ведро на время, прошедшее с прошлого обращения"""
+    elapsed = now - bucket['updated']
+    if elapsed > 0:
+        bucket['tokens'] = min(bucket['burst'], bucket['tokens'] + elapsed * bucket['rate'])
+        bucket['updated'] = now
+
+def bucket_wait_time(bucket, now):
+    """Через сколько секунд в ведре появится целый токен (0 - уже есть)"""
+    refill_bucket(bucket, now)
+    if bucket['tokens'] >= 1:
+        return 0
+    return (1 - bucket['tokens']) / bucket['rate']
+
+def get_chat_bucket(chat_id, now):
+    """Ведро токенов чата (группы и каналы имеют отрицательный id)"""
+    bucket = _chat_buckets.get(chat_id)
+    if bucket is None:
+        if isinstance(chat_id, int) and chat_id < 0:
+            bucket = create_bucket(GROUP_RATE, GROUP_BURST, now)
+        else:
+            bucket = create_bucket(CHAT_RATE, CHAT_BURST, now)
+        _chat_buckets[chat_id] = bucket
+    return bucket
+
+def get_retry_after(error):
+    """Достает retry_after из ошибки 429 Telegram (None - это не 429)"""
+    if getattr(error, 'error_code', None) != 429:
+        return None
+
+    result = getattr(error, 'result_json', None) or {}
+    parameters = result.get('parameters') or {}
+    return parameters.get('retry_after', 1)
+
+def schedule_chat(chat_id, ready_at):
+    """Ставит чат в очередь на отправку не раньше ready_at"""
+    global _sequence
+    _sequence += 1
+    heapq.heappush(_ready_heap, (ready_at, _sequence, chat_id))
+
+def enqueue(chat_id, text, kwargs=None, method='send_message'):
+    """
+    Ставит сообщение в очередь отправки и сразу возвращает управление.
+    method - метод Bot API ('send_message', 'edit_message_text'), лимиты у них общие.
+    Если точно такое же сообщение уже ждет отправки в этот чат,
+    повтор не добавляется. Возвращает True, если сообщение принято.
+    """
+    return enqueue_call(chat_id, method, dict(kwargs or {}, chat_id=chat_id, text=text))
+
+def enqueue_call(chat_id, method, params, limited=True):
+    """
+    Ставит в очередь chat_id вызов Bot API method(**params).
+    limited=False - вызов не расходует лимиты сообщений (ответ на нажатие
+    кнопки, результаты встроенного запроса), но выполняется диспетчером
+    в порядке своей очереди. chat_id здесь - ключ очереди, он может
+    и не совпадать с чатом (например, ('inline', id_пользователя)).
+    """
+    message = {'chat_id': chat_id, 'method': method, 'params': params,
+               'limited': limited, 'attempts': 0}
+
+    with _condition:
+        queue = _chat_queues.get(chat_id)
+        if queue is None:
+            queue = _chat_queues[chat_id] = deque()
+
+        for pending in queue:
+            if pending['method'] == method and pending['params'] == params:
+                _stats['coalesced'] += 1
+                return True
+
+        if len(queue) >= MAX_CHAT_QUEUE:
+            _stats['dropped'] += 1
+            logger.warning(f"⚠️ Очередь чата {chat_id} переполнена, сообщение отброшено")
+            return False
+
+        queue.append(message)
+        if _loop is not None:
+            if chat_id not in _chat_tasks:
+                # Задача чата создается в цикле событий; до этого место занято None
+                _chat_tasks[chat_id] = None
+                _loop.call_soon_threadsafe(start_chat_task, chat_id)
+        else:
+            if len(queue) == 1 and chat_id not in _in_flight:
+                schedule_chat(chat_id, _chat_ready.get(chat_id, 0))
+            _condition.notify()
+
+    return True
+
+def take_next_message():
+    """
+    Ждет, пока какой-нибудь чат можно будет обслужить с учетом лимитов,
+    и забирает из него первое сообщение. Вызывается под _condition.
+    """
+    while True:
+        now = time.monotonic()
+        timeout = None
+
+        if _ready_heap:
+            ready_at, _, chat_id = _ready_heap[0]
+            if ready_at > now:
+                timeout = ready_at - now
+            elif not _chat_queues[chat_id][0]['limited']:
+                # Вызов вне лимитов сообщений - выполняем сразу
+                heapq.heappop(_ready_heap)
+                _in_flight.add(chat_id)
+                return _chat_queues[chat_id].popleft()
+            else:
+                chat_bucket = get_chat_bucket(chat_id, now)
+                chat_wait = bucket_wait_time(chat_bucket, now)
+                if chat_wait > 0:
+                    # Чат исчерпал свой лимит - пропускаем вперед остальные чаты
+                    heapq.heappop(_ready_heap)
+                    schedule_chat(chat_id, now + chat_wait)
+                    continue
+
+                timeout = bucket_wait_time(_global_bucket, now)
+                if timeout <= 0:
+                    heapq.heappop(_ready_heap)
+                    chat_bucket['tokens'] -= 1
+                    _global_bucket['tokens'] -= 1
+                    _in_flight.add(chat_id)
+                    return _chat_queues[chat_id].popleft()
+
+        _condition.wait(timeout)
+
+def release_chat(chat_id):
+    """Убирает чат с пустой очередью. Вызывается под _condition."""
+    del _chat_queues[chat_id]
+    # Полное ведро ничем не отличается от нового - освобождаем память
+    bucket = _chat_buckets.get(chat_id)
+    if bucket is not None:
+        refill_bucket(bucket, time.monotonic())
+        if bucket['tokens'] >= bucket['burst']:
+            del _chat_buckets[chat_id]
+
+def get_retry_delay(message, error):
+    """
+    Разбирает ошибку отправки: через сколько секунд повторить сообщение
+    (None - больше не пытаться). Обновляет счетчики и пишет в лог.
+    """
+    message['attempts'] += 1
+    retry_after = get_retry_after(error)
+
+    with _condition:
+        if retry_after is not None:
+            _stats['rate_limited'] += 1
+            delay = retry_after
+        elif message['attempts'] < MAX_ATTEMPTS and getattr(error, 'error_code', None) is None:
+            # Ошибка сети - пробуем еще раз чуть позже
+            delay = RETRY_DELAY * message['attempts']
+        else:
+            _stats['failed'] += 1
+            delay = None
+
+    if retry_after is not None:
+        logger.warning(f"⏳ Лимит Telegram для чата {message['chat_id']}: повтор через {retry_after} с")
+    elif delay is None:
+        logger.error(f"❌ Не удалось отправить сообщение в чат {message['chat_id']}: {error}")
+
+    return delay
+
+def finish_message(message, retry_at=None):
+    """Возвращает чат в очередь после отправки (или повторяет сообщение)"""
+    chat_id = message['chat_id']
+
+    with _condition:
+        _in_flight.discard(chat_id)
+        queue = _chat_queues[chat_id]
+
+        if retry_at is not None:
+            queue.appendleft(message)
+            _chat_ready[chat_id] = retry_at
+        elif _chat_ready.get(chat_id, 0) <= time.monotonic():
+            _chat_ready.pop(chat_id, None)
+
+        if queue:
+            schedule_chat(chat_id, _chat_ready.get(chat_id, 0))
+            _condition.notify()
+        else:
+            release_chat(chat_id)
+
+def sender_loop():
+    """Рабочий поток: отправляет сообщения по мере освобождения лимитов"""
+    while True:
+        with _condition:
+            message = take_next_message()
+
+        retry_at = None
+        try:
+            _send(message['method'], **message['params'])
+            with _condition:
+                _stats['sent'] += 1
+        except Exception as e:
+            delay = get_retry_delay(message, e)
+            if delay is not None:
+                retry_at = time.monotonic() + delay
+
+        finish_message(message, retry_at)
+
+def start_outbound(send, workers=4):
+    """
+    Запускает диспетчер исходящих сообщений в рабочих потоках.
+    send(method, **params) - блокирующий вызов метода Bot API.
+    """
+    global _send, _global_bucket
+
+    with _condition:
+        if _send is not None:
+            return
+        _send = send
+        _global_bucket = create_bucket(GLOBAL_RATE, GLOBAL_BURST)
+
+    for number in range(workers):
+        threading.Thread(
+            target=sender_loop,
+            name=f'outbound-{number + 1}',
+            daemon=True
+        ).start()
+
+    logger.info(f"📤 Диспетчер отправки запущен ({workers} потоков)")
+
+def start_chat_task(chat_id):
+    """Создает задачу отправки для чата (выполняется в цикле событий)"""
+    with _condition:
+        _chat_tasks[chat_id] = _loop.create_task(chat_sender(chat_id))
+
+async def wait_for_tokens(chat_id):
+    """Ждет (не занимая поток) токен в ведре чата и в общем ведре и забирает их"""
+    while True:
+        with _condition:
+            now = time.monotonic()
+            chat_bucket = get_chat_bucket(chat_id, now)
+            wait = bucket_wait_time(chat_bucket, now) or bucket_wait_time(_global_bucket, now)
+            if wait <= 0:
+                chat_bucket['tokens'] -= 1
+                _global_bucket['tokens'] -= 1
+                return
+        await asyncio.sleep(wait)
+
+async def chat_sender(chat_id):
+    """
+    Задача чата в асинхронном режиме: отправляет его сообщения по порядку.
+    Ожидание лимитов и retry_after - это await asyncio.sleep, поэтому
+    медленный или ограниченный чат не задерживает остальные.
+    """
+    while True:
+        with _condition:
+            queue = _chat_queues[chat_id]
+            if not queue:
+                release_chat(chat_id)
+                del _chat_tasks[chat_id]
+                return
+            message = queue.popleft()
+            _in_flight.add(chat_id)
+
+        while True:
+            if message['limited']:
+                await wait_for_tokens(chat_id)
+            try:
+                await _send(message['method'], **message['params'])
+                with _condition:
+                    _stats['sent'] += 1
+                break
+            except Exception as e:
+                delay = get_retry_delay(message, e)
+                if delay is None:
+                    break
+                await asyncio.sleep(delay)
+
+        with _condition:
+            _in_flight.discard(chat_id)
+
+def start_outbound_async(send):
+    """
+    Запускает диспетчер в текущем цикле событий (вызывается из корутины).
+    send(method, **params) - корутина метода Bot API.
+    Потоков нет: у каждого чата с очередью своя задача.
+    """
+    global _send, _global_bucket, _loop
+
+    with _condition:
+        if _send is not None:
+            return
+        _send = send
+        _global_bucket = create_bucket(GLOBAL_RATE, GLOBAL_BURST)
+        _loop = asyncio.get_running_loop()
+
+    logger.info("📤 Диспетчер отправки запущен (asyncio)")
+
+def is_running():
+    """Запущен ли диспетчер"""
+    return _send is not None
+
+def get_outbound_stats():
+    """Счетчики диспетчера и текущая глубина очереди"""
+    with _condition:
+        stats = dict(_stats)
+        stats['queued'] = sum(len(queue) for queue in _chat_queues.values()) + len(_in_flight)
+        stats['chats'] = len(_chat_queues)
+    return stats
@@ -1,21 +1,159 @@
 import re
-import time
+import os
+import io
+import csv
+import pickle
+import bisect
+import hashlib
+import threading
 from collections import defaultdict
 
-def read_schedule_file():
-    """Читает файл расписания"""
+SCHEDULE_FILE = 'school_schedule.csv'
+
+# Снимок разобранного расписания лежит рядом с CSV.
+# SNAPSHOT_FORMAT увеличивается при любом изменении структуры модели.
+SNAPSHOT_FILE = os.path.splitext(SCHEDULE_FILE)[0] + '.snapshot'
+SNAPSHOT_FORMAT = 11
+
+# Поля состояния, которые собираются до подмены и хранятся в снимке
+SNAPSHOT_FIELDS = ('timetable', 'teacher_index', 'teacher_search_index', 'room_index',
+                   'room_occupancy', 'time_index', 'inline_index')
+
+# Длина n-грамм в индексе поиска учителей
+NGRAM_SIZE = 3
+
+# Нечеткий поиск учителя (при опечатках): минимальная длина запроса
+# и сколько кандидатов из n-граммного индекса проверять по расстоянию
+FUZZY_MIN_QUERY_LENGTH = 4
+FUZZY_MAX_CANDIDATES = 20
+
+def read_schedule_file(path=SCHEDULE_FILE):
+    """Читает файл расписания целиком (пустая строка, если файла нет)"""
     try:
-        with open('school_schedule.csv', 'r', encoding='utf-8') as f:
-            return f.readlines()
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            return f.read()
     except FileNotFoundError:
-        return []
+        return ''
+
+def parse_schedule_rows(content):
+    """
+    Разбирает CSV модулем csv (учитывает кавычки и запятые внутри ячеек).
+    Возвращает сетку: кортеж строк, каждая строка - кортеж ячеек,
+    каждая ячейка очищена от пробелов один раз.
+    """
+    return tuple(
+        tuple(cell.strip() for cell in row)
+        for row in csv.reader(io.StringIO(content))
+    )
+
+def get_schedule_file_signature(path=SCHEDULE_FILE):
+    """Возвращает (mtime, размер) файла расписания или None, если файла нет."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def compute_schedule_version(content):
+    """Хэш содержимого расписания: меняется только вместе с данными."""
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+def create_schedule_state(content, signature):
+    """
+    Создает состояние расписания из содержимого CSV:
+    {
+        'content': текст CSV,
+        'rows': сетка ячеек или None,  # разбирается только по требованию (get_schedule_rows)
+        'version': хэш_содержимого,
+        'signature': (mtime, размер) файла, из которого прочитано содержимое,
+        'timetable': модель или None,            # модель и индексы собираются вместе (load_compiled_schedule)
+        'teacher_index': индекс или None,
+        'teacher_search_index': индекс или None,
+        'room_index': индекс кабинетов или None,
+        'room_occupancy': занятость кабинетов по номерам уроков или None,
+        'time_index': индекс интервалов уроков или None,
+        'inline_index': варианты по префиксам для встроенного режима или None
+    }
+    """
+    return {
+        'content': content,
+        'rows': None,
+        'version': compute_schedule_version(content),
+        'signature': signature,
+        'timetable': None,
+        'teacher_index': None,
+        'teacher_search_index': None,
+        'room_index': None,
+        'room_occupancy': None,
+        'time_index': None,
+        'inline_index': None
+    }
+
+def read_schedule_state(path=SCHEDULE_FILE):
+    """Читает файл расписания в новое (еще не скомпилированное) состояние."""
+    # Подпись снимается до чтения: если файл изменится во время чтения,
+    # следующая проверка заметит расхождение и перечитает его
+    signature = get_schedule_file_signature(path)
+    return create_schedule_state(read_schedule_file(path), signature)
+
+# Текущее расписание. Заменяется целиком одним присваиванием, поэтому
+# запрос, взявший состояние, никогда не видит смесь старых и новых данных.
+_schedule = read_schedule_state()
+_reload_lock = threading.RLock()
+
+def get_schedule_rows(state=None):
+    """
+    Сетка ячеек расписания. CSV разбирается при первом обращении:
+    если модель взята из снимка, разбор не нужен вовсе.
+    """
+    if state is None:
+        state = _schedule
+    
+    schedule_rows = state['rows']
+    if schedule_rows is None:
+        # Разбор детерминирован: при гонке двух потоков результат одинаков
+        schedule_rows = state['rows'] = parse_schedule_rows(state['content'])
+    return schedule_rows
+
+DAYS_OF_WEEK = ('ПОНЕДЕЛЬНИК', 'ВТОРНИК', 'СРЕДА', 'ЧЕТВЕРГ', 'ПЯТНИЦА', 'СУББОТА')
 
-lines = read_schedule_file()
+# Ячейка с названием класса: номер и буква (5А, 10 Е)
+CLASS_CELL_RE = re.compile(r'^(\d+)\s*([А-ЯA-Z])$', re.IGNORECASE)
 
-# Кэши для производительности
-_teacher_index_cache = None
-_teacher_index_cache_time = None
-CACHE_TIMEOUT = 300  # 5 минут
+# Сколько вариантов хранить для одного префикса во встроенном режиме (@bot 5А)
+INLINE_MAX_RESULTS = 20
+
+# Максимальная длина одного сообщения Telegram
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+# Сокращения дней недели (0 - понедельник)
+WEEKDAY_ALIASES = {
+    'пн': 0, 'пон': 0, 'понедельник': 0,
+    'вт': 1, 'вто': 1, 'вторник': 1,
+    'ср': 2, 'сре': 2, 'среда': 2, 'среду': 2,
+    'чт': 3, 'чет': 3, 'четверг': 3,
+    'пт': 4, 'пят': 4, 'пятница': 4, 'пятницу': 4,
+    'сб': 5, 'суб': 5, 'суббота': 5, 'субботу': 5,
+    'вс': 6, 'вос': 6, 'воскресенье': 6
+}
+
+# Время урока: "8:00–8:40", "8.00-8.40"
+TIME_RANGE_RE = re.compile(r'(\d{1,2})[:.](\d{2})\s*[–—-]\s*(\d{1,2})[:.](\d{2})')
+
+# Номер кабинета: "214", "101а" (остальные значения поля - "дистант", "спортзал")
+ROOM_NUMBER_RE = re.compile(r'^\d{1,4}[а-яa-z]?$', re.IGNORECASE)
+
+# Строка считается заголовком блока, если в ней не меньше стольких классов
+MIN_CLASSES_IN_HEADER = 3
+
+def is_class_name(text):
+    """Проверяет, похож ли текст на название класса (5А, 10 Е)."""
+    return CLASS_CELL_RE.match(text) is not None
+
+def class_sort_key(class_name):
+    """Ключ сортировки классов: сначала по номеру, потом по букве."""
+    match = CLASS_CELL_RE.match(class_name)
+    return (int(match.group(1)) if match else 0, class_name)
 
 def normalize_class_name(class_name):
     """Нормализует название класса"""
@@ -23,69 +161,72 @@ def normalize_class_name(class_name):
     normalized = normalized.upper()
     return normalized
 
-def find_all_rows_with_classes():
+def build_header_rows(schedule_rows):
     """
-    Находит ВСЕ строки, содержащие номера классов.
-    Возвращает список кортежей (номер_строки, список_классов_в_строке)
+    Один проход по сетке: находит строки-заголовки блоков (строки с классами)
+    и столбцы классов в них.
+    Возвращает {номер_строки: ((столбец, класс), ...)}.
     """
-    class_rows = []
+    header_rows = {}
     
-    for line_num, line in enumerate(lines):
-        cells = line.strip().split(',')
-        
-        # Собираем все классы из строки
-        classes_in_row = []
-        for cell in cells:
-            cell_clean = cell.strip()
-            if re.match(r'^\d+\s*[А-ЯA-Z]$', cell_clean, re.IGNORECASE):
-                classes_in_row.append(cell_clean)
-        
-        # Если найдено достаточно классов, добавляем в список
-        if len(classes_in_row) >= 3:  # Минимум 3 класса для уверенности
-            class_rows.append((line_num, classes_in_row))
+    for line_num, cells in enumerate(schedule_rows):
+        class_cells = tuple(
+            (col_num, cell) for col_num, cell in enumerate(cells)
+            if cell and cell[0].isdigit() and CLASS_CELL_RE.match(cell)
+        )
+        # Если найдено достаточно классов, это заголовок блока
+        if len(class_cells) >= MIN_CLASSES_IN_HEADER:
+            header_rows[line_num] = class_cells
     
-    return class_rows
+    return header_rows
 
-def get_lessons_for_class_at_position(class_name, class_position, class_row_line):
+def get_header_rows(schedule_rows=None):
+    """Таблица строк-заголовков: для текущего расписания берется из модели."""
+    if schedule_rows is None:
+        return get_timetable()['header_rows']
+    return build_header_rows(schedule_rows)
+
+def find_all_rows_with_classes(schedule_rows=None):
+    """
+    Находит ВСЕ строки, содержащие номера классов.
+    Возвращает список кортежей (номер_строки, список_классов_в_строке)
+    """
+    header_rows = get_header_rows(schedule_rows)
+    return [
+        (line_num, [class_name for col_num, class_name in class_cells])
+        for line_num, class_cells in header_rows.items()
+    ]
+
+def get_lessons_for_class_at_position(class_name, class_position, class_row_line, schedule_rows=None):
     """
     Получает все уроки для класса в конкретной позиции и строке.
     """
+    header_rows = get_header_rows(schedule_rows)
+    if schedule_rows is None:
+        schedule_rows = get_schedule_rows()
+    
     lessons = []
     
     # Ищем строки с временем уроков ниже строки с классом
-    for line_num in range(class_row_line + 1, len(lines)):
-        line = lines[line_num].strip()
-        if not line:
+    for line_num in range(class_row_line + 1, len(schedule_rows)):
+        cells = schedule_rows[line_num]
+        if not any(cells):
             continue
         
-        cells = line.split(',')
-        
         # Если это строка со временем урока
         if len(cells) > 1 and ('–' in cells[1] or '-' in cells[1]):
-            time_str = cells[1].strip()
-            
-            # Собираем данные урока (учитель, предмет, кабинет)
-            data_parts = []
+            time_str = cells[1]
             
-            # Проверяем текущую строку и соседние
-            for offset in range(-1, 2):
-                check_line_num = line_num + offset
-                if 0 <= check_line_num < len(lines):
-                    check_line = lines[check_line_num].strip()
-                    if check_line:
-                        check_cells = check_line.split(',')
-                        if len(check_cells) > class_position:
-                            data = check_cells[class_position].strip()
-                            if data:
-                                data_parts.append(data)
+            # Предмет, учитель и кабинет - строго по своим строкам
+            data_parts = read_lesson_cells(schedule_rows, line_num, class_position, class_row_line, header_rows)
             
             # Формируем информацию об уроке
-            if data_parts:
+            if any(data_parts):
                 lesson_info = {
                     'time': time_str,
-                    'subject': data_parts[0] if len(data_parts) > 0 else '',
-                    'teacher': data_parts[1] if len(data_parts) > 1 else '',
-                    'classroom': data_parts[2] if len(data_parts) > 2 else '',
+                    'subject': data_parts[0],
+                    'teacher': data_parts[1],
+                    'classroom': data_parts[2],
                     'raw_data': data_parts
                 }
                 lessons.append(lesson_info)
@@ -94,121 +235,544 @@ def get_lessons_for_class_at_position(class_name, class_position, class_row_line
         if len(cells) > 1 and 'ВРЕМЯ' in cells[1]:
             break
         # Проверяем, не новая ли это строка с классами
-        if has_classes_in_line(line):
+        if line_num in header_rows:
             break
     
     return lessons
 
-def has_classes_in_line(line):
-    """Проверяет, содержит ли строка номера классов."""
-    cells = line.strip().split(',')
-    class_count = 0
+def has_classes_in_line(cells):
+    """Проверяет, содержит ли строка (кортеж ячеек) номера классов."""
+    class_count = sum(1 for cell in cells if CLASS_CELL_RE.match(cell))
+    return class_count >= MIN_CLASSES_IN_HEADER
+
+def find_day_in_line(cells):
+    """Возвращает день недели, упомянутый в строке, или None."""
     for cell in cells:
-        cell_clean = cell.strip()
-        if re.match(r'^\d+\s*[А-ЯA-Z]$', cell_clean, re.IGNORECASE):
-            class_count += 1
+        cell_upper = cell.upper()
+        for day in DAYS_OF_WEEK:
+            if day in cell_upper:
+                return day
+    return None
+
+def build_day_sections(schedule_rows=None):
+    """
+    Один проход по файлу сверху вниз: для каждой строки запоминает
+    день недели, к которому она относится.
+    Возвращает кортеж длиной len(schedule_rows).
+    """
+    if schedule_rows is None:
+        schedule_rows = get_schedule_rows()
     
-    return class_count >= 3
+    day_sections = []
+    current_day = 'Расписание'
+    
+    for cells in schedule_rows:
+        current_day = find_day_in_line(cells) or current_day
+        day_sections.append(current_day)
+    
+    return tuple(day_sections)
 
 def get_day_section_for_line(line_num):
     """Определяет день недели для строки."""
-    # Ищем ближайший заголовок с днем недели выше
-    for i in range(line_num, -1, -1):
-        if i < len(lines):
-            cells = lines[i].strip().split(',')
-            for cell in cells:
-                cell_upper = cell.upper()
-                if 'ПОНЕДЕЛЬНИК' in cell_upper:
-                    return 'ПОНЕДЕЛЬНИК'
-                elif 'ВТОРНИК' in cell_upper:
-                    return 'ВТОРНИК'
-                elif 'СРЕДА' in cell_upper:
-                    return 'СРЕДА'
-                elif 'ЧЕТВЕРГ' in cell_upper:
-                    return 'ЧЕТВЕРГ'
-                elif 'ПЯТНИЦА' in cell_upper:
-                    return 'ПЯТНИЦА'
-                elif 'СУББОТА' in cell_upper:
-                    return 'СУББОТА'
-    
-    return 'Расписание'
-
-def create_teacher_schedule_index():
+    day_sections = get_timetable()['day_sections']
+    if not day_sections or line_num < 0:
+        return 'Расписание'
+    return day_sections[min(line_num, len(day_sections) - 1)]
+
+def split_slashed_field(field):
+    """Разделяет поле с несколькими значениями через слэш (прямой или обратный)."""
+    raw = field.strip()
+    
+    if '/' in raw or '\\' in raw:
+        # Заменяем разные виды слэшей на стандартный
+        clean = re.sub(r'[\\\/]+', '/', raw)
+        return tuple(part.strip() for part in clean.split('/') if part.strip())
+    
+    return (raw,) if raw else ()
+
+def split_teacher_names(teacher_field):
+    """Разделяет поле учителя на отдельных учителей (через слэш)."""
+    return split_slashed_field(teacher_field)
+
+def split_room_names(classroom_field):
+    """Разделяет поле кабинета на отдельные кабинеты (214/215)."""
+    return split_slashed_field(classroom_field)
+
+def get_grid_cell(cells, col_num):
+    """Ячейка строки сетки (пустая строка, если строка короче)."""
+    return cells[col_num] if len(cells) > col_num else ''
+
+def read_lesson_cells(schedule_rows, time_line, col_num, header_line, header_rows):
     """
-    Создает индекс расписания по учителям.
-    Возвращает словарь: {учитель: [список_уроков]}
+    Читает поля урока класса по их местам в сетке:
+    предмет - строка над строкой времени, учитель - сама строка времени,
+    кабинет - строка под ней. Пустое поле остается пустым и не сдвигает
+    остальные. Строки-заголовки блоков полями урока не считаются.
+    Возвращает (предмет, учитель, кабинет).
     """
-    teacher_index = defaultdict(list)
+    subject_line = time_line - 1
+    room_line = time_line + 1
+    
+    subject = ''
+    if subject_line > header_line and subject_line not in header_rows:
+        subject = get_grid_cell(schedule_rows[subject_line], col_num)
+    
+    room = ''
+    if room_line < len(schedule_rows) and room_line not in header_rows:
+        room = get_grid_cell(schedule_rows[room_line], col_num)
+    
+    return (subject, get_grid_cell(schedule_rows[time_line], col_num), room)
+
+def get_lesson_number(cells, ordinal):
+    """
+    Номер урока по листу: число в первом столбце строки времени ("1", "2.").
+    Если столбец номеров пуст, берется ordinal - порядковый номер строки
+    времени в блоке (он общий для всех классов блока).
+    """
+    match = re.match(r'\d+', cells[0]) if cells else None
+    return int(match.group()) if match else ordinal
+
+def make_lesson_record(time_str, data_parts, class_name, day_section, period=None):
+    """Создает запись урока: поля уже разобраны, учителя разделены."""
+    raw_data = tuple(data_parts)
+    teacher = raw_data[1] if len(raw_data) > 1 else ''
+    
+    return {
+        'time': time_str,
+        'period': period,
+        'subject': raw_data[0] if len(raw_data) > 0 else '',
+        'teacher': teacher,
+        'teachers': split_teacher_names(teacher),
+        'classroom': raw_data[2] if len(raw_data) > 2 else '',
+        'class_name': class_name,
+        'day_section': day_section,
+        'raw_data': raw_data,
+        'data': raw_data,
+        'original_teacher_field': teacher
+    }
+
+def extract_block_lessons(schedule_rows, header_line, columns, header_rows, day_section):
+    """
+    Читает уроки всех классов блока за один проход по строкам.
+    
+    schedule_rows - сетка ячеек файла;
+    columns - {класс: номер_столбца} из строки заголовка блока;
+    header_rows - таблица строк-заголовков (на них блок заканчивается).
     
-    # Находим все строки с классами
-    class_rows = find_all_rows_with_classes()
+    Урок - строка со временем и соседние строки сверху и снизу:
+    предмет / учитель / кабинет читаются по позиции (read_lesson_cells).
+    Столбцы стабильны во всех строках (объединенные ячейки развернуты
+    при загрузке), поэтому номер столбца класса один на весь блок.
+    Номер урока берется из строки времени (get_lesson_number), а не из
+    порядка уроков класса: класс, начинающий день со второго урока,
+    получает номер 2.
+    Возвращает {класс: (урок, ...)}.
+    """
+    lessons = {class_name: [] for class_name in columns}
+    time_rows = 0
     
-    for line_num, classes_in_row in class_rows:
-        # Получаем все классы и их позиции в этой строке
-        cells = lines[line_num].strip().split(',')
+    for line_num in range(header_line + 1, len(schedule_rows)):
+        cells = schedule_rows[line_num]
+        if not any(cells):
+            continue
         
-        # Для каждого класса в строке
-        for col_num, cell in enumerate(cells):
-            cell_clean = cell.strip()
-            if not re.match(r'^\d+\s*[А-ЯA-Z]$', cell_clean, re.IGNORECASE):
-                continue
-            
-            class_name = cell_clean
-            class_position = col_num
-            
-            # Ищем уроки для этого класса
-            lessons = get_lessons_for_class_at_position(class_name, class_position, line_num)
+        # Если это строка со временем урока
+        if len(cells) > 1 and ('–' in cells[1] or '-' in cells[1]):
+            time_str = cells[1]
+            time_rows += 1
+            period = get_lesson_number(cells, time_rows)
             
-            # Добавляем уроки в индекс по учителям
+            for class_name, col_num in columns.items():
+                data_parts = read_lesson_cells(schedule_rows, line_num, col_num, header_line, header_rows)
+                
+                if any(data_parts):
+                    lessons[class_name].append(
+                        make_lesson_record(time_str, data_parts, class_name, day_section, period)
+                    )
+        
+        # Блок заканчивается на следующей строке "ВРЕМЯ" или строке с классами
+        if len(cells) > 1 and 'ВРЕМЯ' in cells[1]:
+            break
+        if line_num in header_rows:
+            break
+    
+    return {class_name: tuple(class_lessons) for class_name, class_lessons in lessons.items()}
+
+def compile_timetable(schedule_rows=None):
+    """
+    Компилирует сетку расписания в модель: дни → блоки классов → уроки.
+    Каждая строка файла разбирается один раз, все поля урока
+    (время, предмет, учителя, кабинет) уже разрешены.
+    
+    Возвращает словарь:
+    {
+        'blocks': (блок, ...),           # в порядке следования в файле
+        'days': {день: (блок, ...)},
+        'classes': (класс, ...),         # отсортированный список классов
+        'class_index': {нормализованный_класс: ((столбец, строка_заголовка), ...)},
+        'class_lessons': {нормализованный_класс: (урок, ...)},  # все дни подряд
+        'class_days': {нормализованный_класс: {день: (урок, ...)}},  # те же уроки по дням
+        'day_sections': (день, ...),     # день недели для каждой строки файла
+        'header_rows': {строка: ((столбец, класс), ...)}  # строки-заголовки блоков
+    }
+    где блок = {
+        'day': день, 'line': номер_строки,
+        'classes': {класс: (урок, ...)}, 'columns': {класс: номер_столбца}
+    }
+    
+    Модель не изменяется после построения - её можно безопасно
+    разделять между всеми запросами.
+    """
+    if schedule_rows is None:
+        schedule_rows = get_schedule_rows()
+    
+    blocks = []
+    days = defaultdict(list)
+    classes = set()
+    class_index = defaultdict(list)
+    class_lessons = defaultdict(list)
+    class_days = defaultdict(lambda: defaultdict(list))
+    day_sections = build_day_sections(schedule_rows)
+    header_rows = build_header_rows(schedule_rows)
+    
+    for line_num, class_cells in header_rows.items():
+        day_section = day_sections[line_num]
+        block_columns = {class_name: col_num for col_num, class_name in class_cells}
+        
+        block_lessons = extract_block_lessons(schedule_rows, line_num, block_columns, header_rows, day_section)
+        
+        for class_name, col_num in block_columns.items():
+            classes.add(class_name)
+            normalized = normalize_class_name(class_name)
+            class_index[normalized].append((col_num, line_num))
+            class_lessons[normalized].extend(block_lessons[class_name])
+            class_days[normalized][day_section].extend(block_lessons[class_name])
+        
+        block = {
+            'day': day_section,
+            'line': line_num,
+            'classes': block_lessons,
+            'columns': block_columns
+        }
+        blocks.append(block)
+        days[day_section].append(block)
+    
+    return {
+        'blocks': tuple(blocks),
+        'days': {day: tuple(day_blocks) for day, day_blocks in days.items()},
+        'classes': tuple(sorted(classes, key=class_sort_key)),
+        'class_index': {name: tuple(positions) for name, positions in class_index.items()},
+        'class_lessons': {name: tuple(lessons) for name, lessons in class_lessons.items()},
+        'class_days': {
+            name: {day: tuple(lessons) for day, lessons in days_lessons.items()}
+            for name, days_lessons in class_days.items()
+        },
+        'day_sections': day_sections,
+        'header_rows': header_rows
+    }
+
+def ensure_schedule_current():
+    """Перечитывает расписание, если файл на диске изменился (mtime/размер)."""
+    if get_schedule_file_signature() != _schedule['signature']:
+        with _reload_lock:
+            # Повторная проверка: файл мог уже перечитать другой поток
+            if get_schedule_file_signature() != _schedule['signature']:
+                reload_schedule()
+
+def save_snapshot(version, compiled):
+    """
+    Сохраняет скомпилированное расписание и все индексы на диск.
+    compiled - {поле_состояния: значение} для полей из SNAPSHOT_FIELDS.
+    """
+    snapshot = {
+        'format': SNAPSHOT_FORMAT,
+        'schedule_version': version,
+        'compiled': compiled
+    }
+    
+    try:
+        # Пишем во временный файл и подменяем - снимок никогда не бывает недописанным
+        tmp_file = SNAPSHOT_FILE + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, SNAPSHOT_FILE)
+    except OSError as e:
+        print(f"⚠️ Не удалось сохранить снимок расписания: {e}")
+
+def load_snapshot(version):
+    """
+    Загружает снимок, если он построен из содержимого CSV с данной версией.
+    Возвращает {поле_состояния: значение} или None.
+    """
+    try:
+        with open(SNAPSHOT_FILE, 'rb') as f:
+            snapshot = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"⚠️ Снимок расписания повреждён: {e}")
+        return None
+    
+    if (not isinstance(snapshot, dict) or
+        snapshot.get('format') != SNAPSHOT_FORMAT or
+        snapshot.get('schedule_version') != version):
+        return None
+    
+    return snapshot['compiled']
+
+def compile_schedule_state(schedule_rows):
+    """
+    Полная сборка: модель расписания и все индексы, нужные запросам.
+    Возвращает {поле_состояния: значение} для полей из SNAPSHOT_FIELDS.
+    """
+    timetable = compile_timetable(schedule_rows)
+    teacher_index, room_index, room_occupancy = create_schedule_indexes(timetable)
+    
+    return {
+        'timetable': timetable,
+        'teacher_index': teacher_index,
+        'teacher_search_index': build_teacher_search_index(teacher_index),
+        'room_index': room_index,
+        'room_occupancy': room_occupancy,
+        'time_index': build_time_index(timetable, teacher_index, room_index),
+        'inline_index': build_inline_index(timetable, teacher_index)
+    }
+
+def load_compiled_schedule(state):
+    """
+    Заполняет состояние моделью расписания и всеми индексами из снимка,
+    а если снимок устарел - полностью разбирает CSV и сохраняет новый снимок.
+    Вызывается до того, как состояние станет текущим (или под _reload_lock),
+    поэтому запросы получают уже готовые индексы.
+    """
+    compiled = load_snapshot(state['version'])
+    if compiled is None:
+        schedule_rows = get_schedule_rows(state)
+        compiled = compile_schedule_state(schedule_rows)
+        if schedule_rows:
+            save_snapshot(state['version'], compiled)
+    
+    # Модель ставится последней: по ней проверяют, собрано ли состояние
+    for field in SNAPSHOT_FIELDS:
+        if field != 'timetable':
+            state[field] = compiled[field]
+    state['timetable'] = compiled['timetable']
+    
+    return state
+
+def get_schedule_state():
+    """
+    Возвращает текущее скомпилированное состояние расписания.
+    Запрос должен брать состояние один раз и дальше работать только с ним.
+    """
+    ensure_schedule_current()
+    state = _schedule
+    
+    if state['timetable'] is None:
+        # Первое обращение после запуска: собирает один поток, остальные ждут
+        with _reload_lock:
+            if state['timetable'] is None:
+                load_compiled_schedule(state)
+    
+    return state
+
+def get_schedule_version():
+    """Возвращает версию (хэш содержимого) текущего расписания."""
+    ensure_schedule_current()
+    return _schedule['version']
+
+def get_timetable():
+    """Возвращает скомпилированное расписание (строит при первом обращении)."""
+    return get_schedule_state()['timetable']
+
+def create_schedule_indexes(timetable=None):
+    """
+    Создает индексы расписания по учителям и по кабинетам и занятость
+    кабинетов по номерам уроков за один проход.
+    Возвращает {учитель: [список_уроков]}, {кабинет: [список_уроков]}
+    и занятость (см. build_room_occupancy).
+    """
+    teacher_index = defaultdict(list)
+    room_index = defaultdict(list)
+    period_slots = defaultdict(lambda: defaultdict(set))   # день -> номер урока -> {(начало, конец)}
+    room_times = defaultdict(lambda: defaultdict(list))    # день -> кабинет -> [(начало, конец)]
+    
+    if timetable is None:
+        timetable = get_timetable()
+    
+    for block in timetable['blocks']:
+        for lessons in block['classes'].values():
             for lesson in lessons:
-                if 'teacher' in lesson and lesson['teacher']:
-                    teacher_names_raw = lesson['teacher'].strip()
-                    
-                    # Обрабатываем несколько учителей через слэш
-                    if '/' in teacher_names_raw or '\\' in teacher_names_raw or '\/' in teacher_names_raw:
-                        # Заменяем разные виды слэшей на стандартный
-                        teacher_names_clean = re.sub(r'[\\\/]+', '/', teacher_names_raw)
-                        # Разделяем учителей
-                        individual_teachers = [t.strip() for t in teacher_names_clean.split('/') if t.strip()]
-                    else:
-                        individual_teachers = [teacher_names_raw]
-                    
-                    # Добавляем урок для каждого учителя
-                    for teacher_name in individual_teachers:
-                        if not teacher_name:
-                            continue
-                            
-                        lesson_info = {
-                            'time': lesson['time'],
-                            'subject': lesson.get('subject', ''),
-                            'classroom': lesson.get('classroom', ''),
-                            'class_name': class_name,
-                            'day_section': get_day_section_for_line(line_num),
-                            'raw_data': lesson.get('raw_data', []),
-                            'original_teacher_field': teacher_names_raw  # Сохраняем оригинальное поле
-                        }
-                        
-                        teacher_index[teacher_name].append(lesson_info)
-    
-    return dict(teacher_index)
+                # Урок добавляется каждому учителю из поля (через слэш)
+                for teacher_name in lesson['teachers']:
+                    teacher_index[teacher_name].append(lesson)
+                # ... и каждому кабинету (214/215 - оба кабинета заняты)
+                rooms = split_room_names(lesson['classroom'])
+                for room in rooms:
+                    room_index[room].append(lesson)
+                
+                time_range = parse_time_range(lesson['time'])
+                day = lesson['day_section']
+                if time_range and day in DAYS_OF_WEEK:
+                    if lesson['period'] is not None:
+                        period_slots[day][lesson['period']].add(time_range)
+                    for room in rooms:
+                        room_times[day][room].append(time_range)
+    
+    room_occupancy = build_room_occupancy(period_slots, room_times, room_index)
+    return dict(teacher_index), dict(room_index), room_occupancy
 
+def create_teacher_schedule_index(timetable=None):
+    """
+    Создает индекс расписания по учителям.
+    Возвращает словарь: {учитель: [список_уроков]}
+    """
+    return create_schedule_indexes(timetable)[0]
 
 
 def get_cached_teacher_index():
-    """Получает закешированный индекс учителей."""
-    global _teacher_index_cache, _teacher_index_cache_time
-    
-    current_time = time.time()
+    """
+    Получает закешированный индекс учителей.
+    Индекс живёт, пока не изменится содержимое файла расписания.
+    """
+    return get_schedule_state()['teacher_index']
+
+def build_teacher_search_index(teacher_index):
+    """
+    Строит структуры для поиска учителей (один раз вместе с индексом):
+    {
+        'order': {учитель: порядковый_номер},       # порядок как в индексе
+        'lower': {учитель: имя_в_нижнем_регистре},
+        'by_lower': {имя_в_нижнем_регистре: (учитель, ...)},  # точное совпадение
+        'ngrams': {подстрока: (учитель, ...)}          # все подстроки длиной 1..NGRAM_SIZE
+    }
+    """
+    order = {}
+    lower = {}
+    by_lower = defaultdict(list)
+    ngrams = defaultdict(list)
     
-    if (_teacher_index_cache is None or 
-        _teacher_index_cache_time is None or 
-        current_time - _teacher_index_cache_time > CACHE_TIMEOUT):
+    for i, teacher_name in enumerate(teacher_index):
+        name_lower = teacher_name.lower()
+        order[teacher_name] = i
+        lower[teacher_name] = name_lower
+        by_lower[name_lower].append(teacher_name)
         
-        _teacher_index_cache = create_teacher_schedule_index()
-        _teacher_index_cache_time = current_time
-        print(f"✅ Создан индекс для {len(_teacher_index_cache)} учителей")
+        grams = set()
+        for size in range(1, NGRAM_SIZE + 1):
+            for start in range(len(name_lower) - size + 1):
+                grams.add(name_lower[start:start + size])
+        for gram in grams:
+            ngrams[gram].append(teacher_name)
+    
+    return {
+        'order': order,
+        'lower': lower,
+        'by_lower': {key: tuple(names) for key, names in by_lower.items()},
+        'ngrams': {gram: tuple(names) for gram, names in ngrams.items()}
+    }
+
+def get_teacher_search_index():
+    """Возвращает поисковый индекс учителей для текущей версии расписания."""
+    return get_schedule_state()['teacher_search_index']
+
+def find_teachers_by_substring(substring, search_index=None):
+    """
+    Находит учителей, чье имя содержит подстроку.
+    Короткие запросы (до NGRAM_SIZE символов) - одно обращение к словарю,
+    длинные - пересечение списков по n-граммам и проверка кандидатов.
+    Возвращает список в порядке индекса учителей.
+    """
+    if search_index is None:
+        search_index = get_teacher_search_index()
+    substring_lower = substring.lower()
+    ngrams = search_index['ngrams']
+    
+    if not substring_lower:
+        return list(search_index['order'])
+    
+    if len(substring_lower) <= NGRAM_SIZE:
+        return list(ngrams.get(substring_lower, ()))
+    
+    grams = {substring_lower[i:i + NGRAM_SIZE] for i in range(len(substring_lower) - NGRAM_SIZE + 1)}
+    
+    candidates = None
+    # Начинаем с самой редкой n-граммы - пересечения получаются короче
+    for gram in sorted(grams, key=lambda g: len(ngrams.get(g, ()))):
+        postings = ngrams.get(gram)
+        if not postings:
+            return []
+        candidates = set(postings) if candidates is None else candidates.intersection(postings)
+        if not candidates:
+            return []
+    
+    name_lower = search_index['lower']
+    matches = [name for name in candidates if substring_lower in name_lower[name]]
+    matches.sort(key=search_index['order'].get)
+    
+    return matches
+
+def bounded_edit_distance(first, second, max_distance):
+    """
+    Расстояние Левенштейна между строками, но не больше max_distance + 1:
+    как только расстояние гарантированно превышает порог, считать дальше незачем.
+    """
+    if abs(len(first) - len(second)) > max_distance:
+        return max_distance + 1
+    
+    previous_row = list(range(len(second) + 1))
+    for i, first_char in enumerate(first, 1):
+        current_row = [i]
+        for j, second_char in enumerate(second, 1):
+            current_row.append(min(
+                previous_row[j] + 1,
+                current_row[j - 1] + 1,
+                previous_row[j - 1] + (first_char != second_char)
+            ))
+        if min(current_row) > max_distance:
+            return max_distance + 1
+        previous_row = current_row
+    
+    return previous_row[-1]
+
+def find_teachers_fuzzy(query, search_index=None):
+    """
+    Нечеткий поиск учителя по фамилии с опечатками.
+    Кандидаты берутся из n-граммного индекса (общие биграммы с запросом),
+    затем ранжируются по ограниченному расстоянию редактирования.
+    Возвращает список учителей от лучшего совпадения к худшему.
+    """
+    query_lower = query.lower().strip()
+    if len(query_lower) < FUZZY_MIN_QUERY_LENGTH:
+        return []
+    
+    if search_index is None:
+        search_index = get_teacher_search_index()
+    ngrams = search_index['ngrams']
+    max_distance = 1 if len(query_lower) <= 5 else 2
+    
+    # Считаем общие биграммы только для учителей, которые есть в индексе по ним
+    shared_grams = defaultdict(int)
+    for gram in {query_lower[i:i + 2] for i in range(len(query_lower) - 1)}:
+        for teacher_name in ngrams.get(gram, ()):
+            shared_grams[teacher_name] += 1
+    
+    candidates = sorted(shared_grams, key=lambda name: -shared_grams[name])[:FUZZY_MAX_CANDIDATES]
+    
+    ranked = []
+    for teacher_name in candidates:
+        name_lower = search_index['lower'][teacher_name]
+        # Сравниваем и с полным именем, и с фамилией (без инициалов)
+        surname = name_lower.split()[0] if name_lower.split() else name_lower
+        distance = min(
+            bounded_edit_distance(query_lower, name_lower, max_distance),
+            bounded_edit_distance(query_lower, surname, max_distance)
+        )
+        if distance <= max_distance:
+            ranked.append((distance, -shared_grams[teacher_name], search_index['order'][teacher_name], teacher_name))
     
-    return _teacher_index_cache
+    ranked.sort()
+    return [item[-1] for item in ranked]
 
 def parse_time(time_str):
     """Парсит время для сортировки."""
@@ -230,9 +794,286 @@ def parse_time(time_str):
     except:
         return 0
 
-def get_schedule_by_teacher(teacher_name):
+def parse_time_range(time_str):
+    """
+    Разбирает время урока "8:00–8:40" в минуты от начала суток.
+    Возвращает (начало, конец) или None, если время не распознано.
+    """
+    match = TIME_RANGE_RE.search(time_str)
+    if not match:
+        return None
+    
+    start_h, start_m, end_h, end_m = map(int, match.groups())
+    start = start_h * 60 + start_m
+    end = end_h * 60 + end_m
+    if end <= start:
+        return None
+    
+    return start, end
+
+def build_interval_index(lessons):
+    """
+    Строит индекс интервалов уроков по дням:
+    {день: (начала, интервалы)}, где начала - отсортированный кортеж минут
+    для bisect, а интервалы - ((начало, конец, урок), ...) в том же порядке.
+    Уроки без распознанного времени в индекс не попадают.
+    """
+    days = defaultdict(list)
+    for lesson in lessons:
+        time_range = parse_time_range(lesson['time'])
+        if time_range and lesson['day_section'] in DAYS_OF_WEEK:
+            days[lesson['day_section']].append((time_range[0], time_range[1], lesson))
+    
+    index = {}
+    for day, intervals in days.items():
+        intervals.sort(key=lambda interval: interval[:2])
+        index[day] = (tuple(interval[0] for interval in intervals), tuple(intervals))
+    
+    return index
+
+def room_sort_key(room):
+    """Ключ сортировки кабинетов: сначала номера по возрастанию, потом названия"""
+    return (0, int(room), '') if room.isdigit() else (1, 0, room.lower())
+
+def is_room_number(room):
+    """Похоже ли значение поля кабинета на номер кабинета (214, 101а)."""
+    return ROOM_NUMBER_RE.match(room) is not None
+
+def build_room_occupancy(period_slots, room_times, rooms):
+    """
+    Занятость кабинетов по номерам уроков.
+    period_slots - {день: {номер_урока: {(начало, конец)}}}: номер урока
+    берется из листа, у разных параллелей может быть разное время звонков,
+    поэтому у номера бывает несколько интервалов;
+    room_times - {день: {кабинет: [(начало, конец), ...]}}; rooms - все кабинеты.
+    Свободными могут считаться только кабинеты с номером: "дистант",
+    "спортзал" и прочие значения поля кабинета в список не попадают.
+    Возвращает {'rooms': (кабинет, ...), 'days': {день: {номер_урока: (интервалы, занятые_кабинеты)}}}.
+    """
+    days = {}
+    for day, day_periods in period_slots.items():
+        day_rooms = room_times.get(day, {})
+        days[day] = {}
+        for number, slots in day_periods.items():
+            # Кабинет занят, если урок в нем пересекается с любым интервалом номера
+            busy = frozenset(
+                room for room, times in day_rooms.items()
+                if any(start < slot_end and end > slot_start
+                       for start, end in times for slot_start, slot_end in slots)
+            )
+            days[day][number] = (tuple(sorted(slots)), busy)
+    
+    return {
+        'rooms': tuple(sorted((room for room in rooms if is_room_number(room)), key=room_sort_key)),
+        'days': days
+    }
+
+def build_time_index(timetable, teacher_index, room_index):
+    """Индексы интервалов для всех классов, учителей и кабинетов"""
+    return {
+        'class': {class_key: build_interval_index(lessons)
+                  for class_key, lessons in timetable['class_lessons'].items()},
+        'teacher': {teacher: build_interval_index(lessons)
+                    for teacher, lessons in teacher_index.items()},
+        'room': {room: build_interval_index(lessons)
+                 for room, lessons in room_index.items()},
+        'rooms_lower': {room.lower(): room for room in room_index}
+    }
+
+def get_time_index(state=None):
+    """Индекс интервалов расписания (собирается вместе с моделью, до подмены состояния)."""
+    if state is None:
+        state = get_schedule_state()
+    return state['time_index']
+
+def find_lessons_at(day_index, day, minute):
+    """
+    Уроки, идущие в данную минуту, и ближайшие следующие в тот же день.
+    Возвращает (текущие, следующие) - списки интервалов (начало, конец, урок).
+    """
+    if day not in day_index:
+        return [], []
+    
+    starts, intervals = day_index[day]
+    position = bisect.bisect_right(starts, minute)
+    
+    # Текущие: последние начавшиеся и еще не закончившиеся.
+    # Уроки одного времени (группы) стоят рядом - идем назад, пока начало то же.
+    current = []
+    if position:
+        last_start = starts[position - 1]
+        i = position - 1
+        while i >= 0 and starts[i] == last_start:
+            if intervals[i][1] > minute:
+                current.append(intervals[i])
+            i -= 1
+        current.reverse()
+    
+    upcoming = []
+    if position < len(intervals):
+        next_start = starts[position]
+        i = position
+        while i < len(intervals) and starts[i] == next_start:
+            upcoming.append(intervals[i])
+            i += 1
+    
+    return current, upcoming
+
+def get_lessons_now(kind, key, weekday, minute, state=None):
+    """
+    Отвечает на вопросы "что сейчас" и "что дальше" для класса или учителя.
+    kind - 'class' или 'teacher', key - нормализованный класс или имя учителя,
+    weekday - день недели (0 - понедельник), minute - минута от начала суток.
+    Возвращает None, если класс/учитель не найден, иначе словарь:
+    {'day': день или None, 'current': [урок, ...], 'next': [урок, ...],
+     'next_day': день следующего урока (если он не сегодня) или None}
+    """
+    day_index = get_time_index(state)[kind].get(key)
+    if day_index is None:
+        return None
+    
+    today = DAYS_OF_WEEK[weekday] if weekday < len(DAYS_OF_WEEK) else None
+    current, upcoming = find_lessons_at(day_index, today, minute) if today else ([], [])
+    next_day = None
+    
+    # Сегодня уроков больше нет - ищем первый урок в следующие дни
+    if not upcoming:
+        for offset in range(1, 8):
+            day_number = (weekday + offset) % 7
+            day = DAYS_OF_WEEK[day_number] if day_number < len(DAYS_OF_WEEK) else None
+            if day in day_index:
+                starts, intervals = day_index[day]
+                upcoming = [interval for interval in intervals if interval[0] == starts[0]]
+                next_day = day
+                break
+    
+    return {
+        'day': today,
+        'current': [interval[2] for interval in current],
+        'next': [interval[2] for interval in upcoming],
+        'next_day': next_day
+    }
+
+def find_room(query, state=None):
+    """Кабинет из расписания по запросу (без учета регистра) или None"""
+    time_index = get_time_index(state)
+    return time_index['rooms_lower'].get(query.strip().lower())
+
+def get_room_lessons(room, weekday, state=None):
+    """
+    Уроки в кабинете за день (weekday: 0 - понедельник), по времени.
+    Возвращает None, если такого кабинета нет в расписании.
+    """
+    day_index = get_time_index(state)['room'].get(room)
+    if day_index is None:
+        return None
+    
+    day = DAYS_OF_WEEK[weekday] if weekday < len(DAYS_OF_WEEK) else None
+    if day not in day_index:
+        return []
+    
+    return [interval[2] for interval in day_index[day][1]]
+
+def get_free_rooms(weekday, period, state=None):
+    """
+    Свободные кабинеты на уроке с номером period в день weekday.
+    Возвращает None, если в этот день нет такого урока, иначе
+    {'day': день, 'period': номер, 'times': (интервал, ...), 'free': [кабинет, ...]}.
+    В 'free' только кабинеты с номером (см. build_room_occupancy).
+    """
+    if state is None:
+        state = get_schedule_state()
+    room_occupancy = state['room_occupancy']
+    day = DAYS_OF_WEEK[weekday] if weekday < len(DAYS_OF_WEEK) else None
+    
+    day_occupancy = room_occupancy['days'].get(day)
+    if not day_occupancy or period not in day_occupancy:
+        return None
+    
+    slots, busy = day_occupancy[period]
+    return {
+        'day': day,
+        'period': period,
+        'times': slots,
+        'free': [room for room in room_occupancy['rooms'] if room not in busy]
+    }
+
+def parse_weekday(text, today):
+    """
+    Распознает день недели: "пн", "вторник", "сегодня", "завтра".
+    today - текущий день недели (0 - понедельник). Возвращает номер дня или None.
+    """
+    text = text.strip().lower().rstrip('.')
+    if text == 'сегодня':
+        return today
+    if text == 'завтра':
+        return (today + 1) % 7
+    if text == 'послезавтра':
+        return (today + 2) % 7
+    return WEEKDAY_ALIASES.get(text)
+
+def normalize_inline_query(query):
+    """Запрос встроенного режима: нижний регистр, "5 а" -> "5а"."""
+    query = ' '.join(query.lower().split())
+    if query[:1].isdigit():
+        query = query.replace(' ', '')
+    return query
+
+def build_inline_index(timetable, teacher_index):
+    """
+    Готовые списки вариантов для встроенного режима:
+    {префикс: ((вид, ключ, название), ...)} - не больше INLINE_MAX_RESULTS
+    на префикс. Префиксы берутся от начала названия и от начала каждого слова.
+    Пустой префикс - первые классы и учителя.
+    """
+    entries = [('class', normalize_class_name(name), name) for name in timetable['classes']]
+    entries += [('teacher', name, name) for name in sorted(teacher_index, key=str.lower)]
+    
+    index = defaultdict(list)
+    index[''] = entries[:INLINE_MAX_RESULTS]
+    for entry in entries:
+        text = normalize_inline_query(entry[2])
+        prefixes = set()
+        for word_start in [0] + [i + 1 for i, char in enumerate(text) if char == ' ']:
+            for end in range(word_start + 1, len(text) + 1):
+                prefixes.add(text[word_start:end])
+        
+        for prefix in prefixes:
+            candidates = index[prefix]
+            if len(candidates) < INLINE_MAX_RESULTS:
+                candidates.append(entry)
+    
+    return {prefix: tuple(candidates) for prefix, candidates in index.items()}
+
+def get_inline_candidates(query, state=None):
+    """Варианты классов и учителей для запроса встроенного режима"""
+    if state is None:
+        state = get_schedule_state()
+    
+    return state['inline_index'].get(normalize_inline_query(query), ())
+
+def find_teacher_names(query, search_index=None):
+    """
+    Имена учителей для запроса без построения их расписания:
+    точные совпадения (без учета регистра), иначе - по подстроке.
+    """
+    if search_index is None:
+        search_index = get_teacher_search_index()
+    query_lower = query.strip().lower()
+    
+    exact = search_index['by_lower'].get(query_lower)
+    if exact:
+        return list(exact)
+    
+    return find_teachers_by_substring(query_lower, search_index)
+
+def get_schedule_by_teacher(teacher_name, state=None):
     """Получает расписание для конкретного учителя."""
-    teacher_index = get_cached_teacher_index()
+    # Индексы берутся из одного состояния, даже если расписание сейчас обновляется
+    if state is None:
+        state = get_schedule_state()
+    teacher_index = state['teacher_index']
+    search_index = state['teacher_search_index']
     
     # Поиск учителя (регистронезависимый)
     teacher_name_lower = teacher_name.lower()
@@ -240,19 +1081,20 @@ def get_schedule_by_teacher(teacher_name):
     exact_matches = []
     partial_matches = []
     
-    for teacher_key, lessons in teacher_index.items():
-        # Точное совпадение (игнорируя регистр)
-        if teacher_name_lower == teacher_key.lower():
-            exact_matches.append({
-                'teacher': teacher_key,
-                'lessons': lessons,
-                'match_type': 'exact'
-            })
-        # Частичное совпадение
-        elif teacher_name_lower in teacher_key.lower():
+    # Точное совпадение (игнорируя регистр)
+    for teacher_key in search_index['by_lower'].get(teacher_name_lower, ()):
+        exact_matches.append({
+            'teacher': teacher_key,
+            'lessons': teacher_index[teacher_key],
+            'match_type': 'exact'
+        })
+    
+    # Частичное совпадение
+    if not exact_matches:
+        for teacher_key in find_teachers_by_substring(teacher_name_lower, search_index):
             partial_matches.append({
                 'teacher': teacher_key,
-                'lessons': lessons,
+                'lessons': teacher_index[teacher_key],
                 'match_type': 'partial'
             })
     
@@ -310,6 +1152,21 @@ def get_schedule_by_teacher(teacher_name):
                 'match_type': 'partial'
             }
     
+    # Ничего не нашлось - пробуем нечеткий поиск (опечатки)
+    fuzzy_matches = find_teachers_fuzzy(teacher_name_lower, search_index)
+    if fuzzy_matches:
+        best_match = fuzzy_matches[0]
+        sorted_lessons = sorted(teacher_index[best_match], key=lambda x: parse_time(x['time']))
+        
+        return {
+            'teacher': teacher_name,
+            'lessons': sorted_lessons,
+            'total_lessons': len(sorted_lessons),
+            'found_as': best_match,
+            'match_type': 'fuzzy',
+            'suggestions': fuzzy_matches[1:]
+        }
+    
     return None
 
 def remove_duplicate_lessons(lessons):
@@ -335,38 +1192,38 @@ def remove_duplicate_lessons(lessons):
 
 def search_teachers_by_substring(substring):
     """Ищет учителей по подстроке в фамилии."""
-    teacher_index = get_cached_teacher_index()
-    substring_lower = substring.lower()
+    state = get_schedule_state()
+    teacher_index = state['teacher_index']
     
-    matches = []
-    for teacher_name, lessons in teacher_index.items():
-        if substring_lower in teacher_name.lower() and lessons:
-            # Проверяем, не является ли это составным учителем
-            if '/' in teacher_name or '\\' in teacher_name:
-                individual_teachers = re.split(r'[\\\/]+', teacher_name)
-                main_teacher = individual_teachers[0].strip() if individual_teachers else teacher_name
-            else:
-                main_teacher = teacher_name
-            
-            # Если уже есть этот учитель в результатах, объединяем уроки
-            existing_match = None
-            for match in matches:
-                if match['name'] == main_teacher:
-                    existing_match = match
-                    break
-            
-            if existing_match:
-                existing_match['lesson_count'] += len(lessons)
-            else:
-                matches.append({
-                    'name': main_teacher,
-                    'full_name': teacher_name,
-                    'lesson_count': len(lessons),
-                    'sample_lesson': lessons[0] if lessons else None,
-                    'is_combined': '/' in teacher_name or '\\' in teacher_name
-                })
+    # Результаты группируются по основному учителю
+    matches_by_teacher = {}
+    for teacher_name in find_teachers_by_substring(substring, state['teacher_search_index']):
+        lessons = teacher_index[teacher_name]
+        if not lessons:
+            continue
+        
+        # Проверяем, не является ли это составным учителем
+        if '/' in teacher_name or '\\' in teacher_name:
+            individual_teachers = re.split(r'[\\\/]+', teacher_name)
+            main_teacher = individual_teachers[0].strip() if individual_teachers else teacher_name
+        else:
+            main_teacher = teacher_name
+        
+        # Если уже есть этот учитель в результатах, объединяем уроки
+        existing_match = matches_by_teacher.get(main_teacher)
+        if existing_match:
+            existing_match['lesson_count'] += len(lessons)
+        else:
+            matches_by_teacher[main_teacher] = {
+                'name': main_teacher,
+                'full_name': teacher_name,
+                'lesson_count': len(lessons),
+                'sample_lesson': lessons[0],
+                'is_combined': '/' in teacher_name or '\\' in teacher_name
+            }
     
     # Сортируем по количеству уроков
+    matches = list(matches_by_teacher.values())
     matches.sort(key=lambda x: x['lesson_count'], reverse=True)
     
     return matches
@@ -384,15 +1241,19 @@ def format_teacher_schedule(teacher_info):
     if not lessons:
         return f"📭 У учителя *{teacher_name}* нет уроков в расписании"
     
-    message = f"👨‍🏫 *Расписание учителя {teacher_name}:*\n"
+    parts = [f"👨‍🏫 *Расписание учителя {teacher_name}:*\n"]
     
     # Добавляем информацию о том, как найден учитель
     if match_type == 'partial' and found_as != teacher_name:
-        message += f"(найдено как: *{found_as}*)\n"
+        parts.append(f"(найдено как: *{found_as}*)\n")
     elif match_type == 'multiple':
-        message += f"(объединено из: *{found_as}*)\n"
+        parts.append(f"(объединено из: *{found_as}*)\n")
+    elif match_type == 'fuzzy':
+        parts.append(f"(возможно, вы имели в виду: *{found_as}*)\n")
+        if teacher_info.get('suggestions'):
+            parts.append(f"(похожие: {', '.join(teacher_info['suggestions'])})\n")
     
-    message += "\n"
+    parts.append("\n")
     
     # Группируем уроки по дням
     lessons_by_day = defaultdict(list)
@@ -402,7 +1263,7 @@ def format_teacher_schedule(teacher_info):
     
     # Выводим по дням
     for day, day_lessons in sorted(lessons_by_day.items()):
-        message += f"*{day}:*\n"
+        parts.append(f"*{day}:*\n")
         
         for i, lesson in enumerate(day_lessons, 1):
             time_display = lesson['time'].replace('–', '-')
@@ -425,13 +1286,13 @@ def format_teacher_schedule(teacher_info):
                 
                 lesson_text += f" каб. {classroom_display}"
             
-            message += f"  {lesson_text}\n"
+            parts.append(f"  {lesson_text}\n")
         
-        message += "\n"
+        parts.append("\n")
     
-    message += f"📊 Всего уроков: {len(lessons)}"
+    parts.append(f"📊 Всего уроков: {len(lessons)}")
     
-    return message
+    return ''.join(parts)
 
 def format_teachers_search_results(matches, search_query):
     """Форматирует результаты поиска учителей."""
@@ -465,84 +1326,385 @@ def format_teachers_search_results(matches, search_query):
     
     return message
 
+def class_lesson_identity(lesson):
+    """Урок класса узнается по предмету и учителю"""
+    return (lesson['subject'], lesson['teacher'])
+
+def teacher_lesson_identity(lesson):
+    """Урок учителя узнается по предмету и классу"""
+    return (lesson['subject'], lesson['class_name'])
+
+def diff_lessons(old_lessons, new_lessons, identity):
+    """
+    Сравнивает два списка уроков одного класса или учителя.
+    Урок на том же месте (день и время) с другим кабинетом - смена кабинета,
+    тот же урок в другом месте - перенос. Возвращает словарь
+    {'added', 'removed', 'moved', 'room_changed'} или None, если изменений нет.
+    В moved и room_changed лежат пары (старый_урок, новый_урок).
+    """
+    old_slots = defaultdict(list)
+    for lesson in old_lessons:
+        old_slots[(lesson['day_section'], lesson['time'], identity(lesson))].append(lesson)
+    
+    added = []
+    room_changed = []
+    for lesson in new_lessons:
+        same_slot = old_slots.get((lesson['day_section'], lesson['time'], identity(lesson)))
+        if same_slot:
+            old_lesson = same_slot.pop(0)
+            if old_lesson['classroom'] != lesson['classroom']:
+                room_changed.append((old_lesson, lesson))
+        else:
+            added.append(lesson)
+    
+    removed = [lesson for slot_lessons in old_slots.values() for lesson in slot_lessons]
+    
+    # Пропавший и появившийся урок с одним предметом и учителем - это перенос
+    moved = []
+    for old_lesson in list(removed):
+        for new_lesson in added:
+            if identity(new_lesson) == identity(old_lesson):
+                moved.append((old_lesson, new_lesson))
+                removed.remove(old_lesson)
+                added.remove(new_lesson)
+                break
+    
+    if not (added or removed or moved or room_changed):
+        return None
+    
+    return {
+        'added': tuple(added),
+        'removed': tuple(removed),
+        'moved': tuple(moved),
+        'room_changed': tuple(room_changed)
+    }
+
+def diff_schedules(old_state, new_state):
+    """
+    Сравнивает два скомпилированных состояния расписания.
+    Возвращает {'classes': {нормализованный_класс: изменения},
+                'teachers': {учитель: изменения}} - только то, что изменилось.
+    """
+    old_classes = old_state['timetable']['class_lessons']
+    new_classes = new_state['timetable']['class_lessons']
+    old_teachers = old_state['teacher_index']
+    new_teachers = new_state['teacher_index']
+    
+    class_changes = {}
+    for class_key in set(old_classes) | set(new_classes):
+        changes = diff_lessons(old_classes.get(class_key, ()), new_classes.get(class_key, ()),
+                               class_lesson_identity)
+        if changes:
+            class_changes[class_key] = changes
+    
+    teacher_changes = {}
+    for teacher in set(old_teachers) | set(new_teachers):
+        changes = diff_lessons(old_teachers.get(teacher, ()), new_teachers.get(teacher, ()),
+                               teacher_lesson_identity)
+        if changes:
+            teacher_changes[teacher] = changes
+    
+    return {'classes': class_changes, 'teachers': teacher_changes}
+
+def format_lesson_place(lesson):
+    """День и время урока для сообщений об изменениях"""
+    day = lesson.get('day_section') or ''
+    return f"{day.capitalize()} {lesson['time']}".strip()
+
+def format_schedule_changes(title, changes, show_class=False, max_lines=15):
+    """
+    Форматирует изменения одного класса или учителя для Telegram.
+    show_class - показывать класс вместо учителя (для расписания учителя).
+    """
+    def describe(lesson):
+        who = lesson['class_name'] if show_class else lesson['teacher']
+        details = [value for value in (who, lesson['classroom'] and f"каб. {lesson['classroom']}") if value]
+        return f"{lesson['subject']} ({', '.join(details)})" if details else lesson['subject']
+    
+    lines = []
+    for lesson in changes['added']:
+        lines.append(f"➕ {format_lesson_place(lesson)}: {describe(lesson)}")
+    for lesson in changes['removed']:
+        lines.append(f"➖ {format_lesson_place(lesson)}: {describe(lesson)}")
+    for old_lesson, new_lesson in changes['moved']:
+        lines.append(
+            f"🔀 {describe(new_lesson)}: {format_lesson_place(old_lesson)} → {format_lesson_place(new_lesson)}"
+        )
+    for old_lesson, new_lesson in changes['room_changed']:
+        lines.append(
+            f"🚪 {format_lesson_place(new_lesson)}: {new_lesson['subject']} - "
+            f"каб. {old_lesson['classroom'] or '?'} → {new_lesson['classroom'] or '?'}"
+        )
+    
+    if len(lines) > max_lines:
+        hidden = len(lines) - max_lines
+        lines = lines[:max_lines] + [f"... и еще {hidden} изменений"]
+    
+    return f"*{title}:*\n" + '\n'.join(lines)
+
+def format_lessons_now(title, result, minute, show_class=False, show_current=True):
+    """
+    Короткий ответ "сейчас / дальше" (результат get_lessons_now).
+    show_class - показывать класс вместо учителя (для учителя),
+    show_current=False - только следующий урок.
+    """
+    def describe(lesson):
+        who = lesson['class_name'] if show_class else lesson['teacher']
+        details = [value for value in (who, lesson['classroom'] and f"каб. {lesson['classroom']}") if value]
+        subject = lesson['subject'] or 'Урок'
+        return f"{subject} ({', '.join(details)})" if details else subject
+    
+    now_text = f"{minute // 60}:{minute % 60:02d}"
+    if result['day']:
+        now_text = f"{result['day'].capitalize()}, {now_text}"
+    
+    parts = [f"🕐 *{title}* - {now_text}\n\n"]
+    
+    if show_current:
+        if result['current']:
+            parts.append(f"▶️ *Сейчас* ({result['current'][0]['time']}):\n")
+            for lesson in result['current']:
+                parts.append(f"   {describe(lesson)}\n")
+        else:
+            parts.append("▶️ Сейчас урока нет\n")
+        parts.append("\n")
+    
+    if result['next']:
+        when = result['next'][0]['time']
+        if result['next_day']:
+            when = f"{result['next_day'].capitalize()}, {when}"
+        parts.append(f"⏭ *Дальше* ({when}):\n")
+        for lesson in result['next']:
+            parts.append(f"   {describe(lesson)}\n")
+    else:
+        parts.append("⏭ Больше уроков нет\n")
+    
+    return ''.join(parts)
+
+def format_schedules_batch(results):
+    """Одно общее сообщение по результатам get_schedules_batch"""
+    sections = []
+    for result in results:
+        if result['kind'] == 'class':
+            sections.append(format_schedule_for_telegram(result['name'], result['lessons']).rstrip())
+        elif result['kind'] == 'teacher':
+            sections.append(format_teacher_schedule(result['teacher_info']).rstrip())
+        else:
+            sections.append(f"❌ *{result['query']}* - не найден ни класс, ни учитель")
+    
+    return '\n\n➖➖➖➖➖➖➖➖\n\n'.join(sections)
+
+def split_message(text, limit=TELEGRAM_MESSAGE_LIMIT):
+    """
+    Делит длинный текст на части не длиннее limit.
+    Режет по пустым строкам, затем по строкам - разметка (*жирный*)
+    внутри строки не разрывается. Строка длиннее limit режется как есть.
+    """
+    if len(text) <= limit:
+        return [text]
+    
+    chunks = []
+    current = ''
+    for line in text.split('\n'):
+        while len(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ''
+            chunks.append(line[:limit])
+            line = line[limit:]
+        
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) <= limit:
+            current = candidate
+            continue
+        
+        # Переносим в следующую часть, начиная с последнего абзаца, если он помещается
+        paragraph_start = current.rfind('\n\n')
+        if paragraph_start > 0 and len(current) - paragraph_start + len(line) + 1 <= limit:
+            chunks.append(current[:paragraph_start])
+            current = current[paragraph_start + 2:] + '\n' + line
+        else:
+            chunks.append(current)
+            current = line
+    
+    if current.strip():
+        chunks.append(current)
+    
+    return chunks
+
+def format_time_slot(start, end):
+    """Интервал в минутах в виде 8:00–8:40"""
+    return f"{start // 60}:{start % 60:02d}–{end // 60}:{end % 60:02d}"
+
+def format_free_rooms(result):
+    """Ответ на запрос свободных кабинетов (результат get_free_rooms)"""
+    times = ', '.join(format_time_slot(start, end) for start, end in result['times'])
+    message = f"🚪 *Свободные кабинеты - {result['day'].capitalize()}, {result['period']}-й урок* ({times}):\n\n"
+    
+    if result['free']:
+        message += ', '.join(result['free'])
+    else:
+        message += "Свободных кабинетов нет"
+    
+    # Список собран из расписания: кабинеты без уроков в нем не встречаются
+    message += "\n\nℹ️ Учитываются только номерные кабинеты, где по расписанию бывают уроки"
+    return message
+
+def format_room_lessons(room, day, lessons):
+    """Занятость кабинета за день (результат get_room_lessons)"""
+    title = f"🏫 *Кабинет {room}*"
+    if day:
+        title += f" - {day.capitalize()}"
+    
+    if not lessons:
+        return f"{title}\n\nУроков нет - кабинет свободен весь день"
+    
+    parts = [f"{title}:\n\n"]
+    for lesson in lessons:
+        details = ', '.join(value for value in (lesson['class_name'], lesson['teacher']) if value)
+        parts.append(f"*{lesson['time']}* {lesson['subject']} ({details})\n")
+    
+    return ''.join(parts)
+
 # === Старые функции (для обратной совместимости) ===
 
+def find_class_positions(class_name):
+    """Возвращает все позиции класса в файле: [(столбец, строка_заголовка), ...]"""
+    positions = get_timetable()['class_index'].get(normalize_class_name(class_name), ())
+    return list(positions)
+
 def find_class_position(class_name):
-    """Находит позицию класса в файле"""
-    normalized_target = normalize_class_name(class_name)
-    
-    for line_num, line in enumerate(lines):
-        cells = line.strip().split(',')
-        for i, cell in enumerate(cells):
-            cell_normalized = normalize_class_name(cell)
-            if normalized_target == cell_normalized:
-                return i, line_num
+    """Находит позицию класса в файле (первый блок)"""
+    positions = find_class_positions(class_name)
+    if positions:
+        return positions[0]
     return -1, -1
 
 def get_schedule_for_class(class_name):
-    """Получает расписание для класса (старая функция)"""
-    class_position, start_line = find_class_position(class_name)
+    """Получает расписание для класса за все дни"""
+    lessons = get_timetable()['class_lessons'].get(normalize_class_name(class_name))
     
-    if class_position == -1:
+    if lessons is None:
         return None
     
-    lessons = []
+    return list(lessons)
+
+def get_class_days(class_name, state=None):
+    """
+    Расписание класса по дням: (название_класса, {день: (урок, ...)})
+    или None, если класс не найден.
+    """
+    if state is None:
+        state = get_schedule_state()
+    
+    normalized = normalize_class_name(class_name)
+    class_days = state['timetable']['class_days'].get(normalized)
+    if class_days is None:
+        return None
     
-    for line_num in range(start_line + 1, len(lines)):
-        line = lines[line_num].strip()
-        cells = line.split(',')
+    lessons = state['timetable']['class_lessons'][normalized]
+    display_name = lessons[0]['class_name'] if lessons else normalized
+    return display_name, class_days
+
+def get_schedules_batch(queries):
+    """
+    Расписания сразу для нескольких классов и учителей.
+    Все запросы разрешаются по одному состоянию расписания, повторы
+    (5А и 5 а) убираются. Возвращает список в порядке запросов:
+    {'query': запрос, 'kind': 'class' | 'teacher' | None,
+     'name': название класса, 'lessons': уроки класса, 'teacher_info': расписание учителя}
+    kind = None - ничего не найдено.
+    """
+    state = get_schedule_state()
+    class_lessons = state['timetable']['class_lessons']
+    
+    results = []
+    seen = set()
+    for query in queries:
+        query = query.strip()
+        if not query:
+            continue
         
-        if len(cells) > 1 and 'ВРЕМЯ' in cells[1]:
-            break
+        if is_class_name(query):
+            key = ('class', normalize_class_name(query))
+        else:
+            key = ('teacher', query.lower())
+        if key in seen:
+            continue
+        seen.add(key)
         
-        if len(cells) > 1 and ('–' in cells[1] or '-' in cells[1]):
-            time_str = cells[1].strip()
-            
-            data_parts = []
-            for offset in range(-1, 2):
-                check_line_num = line_num + offset
-                if 0 <= check_line_num < len(lines):
-                    check_line = lines[check_line_num].strip()
-                    if check_line:
-                        check_cells = check_line.split(',')
-                        if len(check_cells) > class_position:
-                            data = check_cells[class_position].strip()
-                            if data:
-                                data_parts.append(data)
-            
-            if data_parts:
-                lessons.append({
-                    'time': time_str,
-                    'data': data_parts
-                })
+        result = {'query': query, 'kind': None, 'name': query, 'lessons': None, 'teacher_info': None}
+        if key[0] == 'class':
+            lessons = class_lessons.get(key[1])
+            if lessons is not None:
+                result['kind'] = 'class'
+                result['name'] = lessons[0]['class_name'] if lessons else key[1]
+                result['lessons'] = list(lessons)
+        else:
+            teacher_info = get_schedule_by_teacher(query, state)
+            if teacher_info:
+                result['kind'] = 'teacher'
+                result['teacher_info'] = teacher_info
+        
+        results.append(result)
     
-    return lessons
+    return results
 
 def format_schedule_for_telegram(class_name, lessons):
     """Форматирует расписание для Telegram (как в консоли)"""
     if not lessons:
         return f"📭 Нет уроков для класса {class_name}"
     
-    message = f"📚 *Расписание для класса {class_name}:*\n\n"
+    parts = [f"📚 *Расписание для класса {class_name}:*\n\n"]
     
-    for i, lesson in enumerate(lessons, 1):
-        message += f"*{i}. {lesson['time']}*\n"
+    current_day = None
+    i = 0
+    for lesson in lessons:
+        # Заголовок дня (уроки идут подряд по дням)
+        day = lesson.get('day_section')
+        if day and day != current_day:
+            current_day = day
+            i = 0
+            parts.append(f"*{day}:*\n")
+        
+        i += 1
+        parts.append(f"*{i}. {lesson['time']}*\n")
         
         # Первая строка: предмет (если есть)
         if len(lesson['data']) >= 1 and lesson['data'][0]:
-            message += f"   📖 {lesson['data'][0]}\n"
+            parts.append(f"   📖 {lesson['data'][0]}\n")
         
         # Вторая строка: учитель (если есть)
         if len(lesson['data']) >= 2 and lesson['data'][1]:
-            message += f"   👨‍🏫 {lesson['data'][1]}\n"
+            parts.append(f"   👨‍🏫 {lesson['data'][1]}\n")
         
         # Третья строка: кабинет (если есть)
         if len(lesson['data']) >= 3 and lesson['data'][2]:
-            message += f"   🏫 {lesson['data'][2]}\n"
+            parts.append(f"   🏫 {lesson['data'][2]}\n")
         
-        message += "\n"
+        parts.append("\n")
     
-    return message
+    return ''.join(parts)
+
+def format_class_day_for_telegram(class_name, day, lessons):
+    """Компактное расписание класса на один день: одна строка на урок"""
+    title = f"📚 *{class_name}"
+    if day:
+        title += f" - {day.capitalize()}"
+    title += ":*\n\n"
+    
+    if not lessons:
+        return title + "📭 Уроков нет"
+    
+    parts = [title]
+    for i, lesson in enumerate(lessons, 1):
+        line = f"*{i}. {lesson['time']}* {lesson['subject'] or '—'}"
+        details = [value for value in (lesson['teacher'], lesson['classroom'] and f"каб. {lesson['classroom']}") if value]
+        if details:
+            line += f" ({', '.join(details)})"
+        parts.append(line + "\n")
+    
+    return ''.join(parts)
 
 def format_schedule_for_console(class_name, lessons):
     """Форматирует расписание для консоли (старый формат)"""
@@ -569,33 +1731,55 @@ def format_schedule_for_console(class_name, lessons):
 
 def get_available_classes():
     """Получает список доступных классов"""
-    classes = set()
-    
-    for line in lines:
-        cells = line.strip().split(',')
-        for cell in cells:
-            cell_clean = cell.strip()
-            if re.match(r'^\d+\s*[А-ЯA-Z]$', cell_clean, re.IGNORECASE):
-                classes.add(cell_clean)
-    
-    return sorted(list(classes), key=lambda x: (int(re.search(r'\d+', x).group()), x))
+    return list(get_timetable()['classes'])
+
+def swap_schedule(state):
+    """Делает состояние текущим (одно присваивание ссылки)."""
+    global _schedule
+    _schedule = state
 
 def reload_schedule():
-    """Перезагружает расписание из файла"""
-    global lines
-    lines = read_schedule_file()
+    """
+    Перезагружает расписание из файла и возвращает новое состояние.
+    Индексы не сбрасываются на месте: новое состояние собирается целиком
+    и подменяется одним присваиванием, поэтому отдельный хук сброса не нужен.
+    """
+    with _reload_lock:
+        state = read_schedule_state()
+        current = _schedule
+        
+        if state['version'] == current['version'] and current['timetable'] is not None:
+            # Содержимое не изменилось - модель и индексы остаются прежними
+            state = dict(current, signature=state['signature'])
+        else:
+            load_compiled_schedule(state)
+        
+        swap_schedule(state)
+    
+    return state
+
+def install_schedule_file(new_file):
+    """
+    Заменяет файл расписания новым (например, только что скачанным).
+    Модель и индексы строятся заранее, вне блокировки; затем файл
+    подменяется через os.replace, а состояние - одним присваиванием.
+    Возвращает новое состояние.
+    """
+    # os.replace сохраняет mtime и размер, поэтому подпись временного
+    # файла совпадет с подписью файла расписания после подмены
+    state = read_schedule_state(new_file)
+    load_compiled_schedule(state)
     
-    # Сбрасываем кэш учителей
-    global _teacher_index_cache, _teacher_index_cache_time
-    _teacher_index_cache = None
-    _teacher_index_cache_time = None
+    with _reload_lock:
+        os.replace(new_file, SCHEDULE_FILE)
+        swap_schedule(state)
     
-    return lines
+    return state
 
 def has_schedule_file():
     """Проверяет наличие файла расписания"""
     try:
-        with open('school_schedule.csv', 'r', encoding='utf-8'):
+        with open(SCHEDULE_FILE, 'r', encoding='utf-8'):
             return True
     except FileNotFoundError:
         return False
\ No newline at end of file
@@ -0,0 +1,109 @@
+import os
+import time
+import sqlite3
+import threading
+
+# Виды подписок: на расписание класса или учителя
+KIND_CLASS = 'class'
+KIND_TEACHER = 'teacher'
+
+# Файл базы подписок (на Railway стоит указать путь на постоянном томе)
+DATABASE_FILE = os.getenv('SUBSCRIPTIONS_DB', 'subscriptions.db')
+
+# Первичный ключ (чат, вид, ключ) - выборка подписок чата,
+# индекс (вид, ключ, чат) - обратный индекс для рассылки изменений
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS subscriptions ("
+    " chat_id INTEGER NOT NULL,"
+    " kind TEXT NOT NULL,"
+    " key TEXT NOT NULL,"
+    " created REAL NOT NULL,"
+    " PRIMARY KEY (chat_id, kind, key)"
+    ") WITHOUT ROWID",
+    "CREATE INDEX IF NOT EXISTS subscriptions_by_target"
+    " ON subscriptions (kind, key, chat_id)"
+)
+
+# Одно соединение на процесс; обращения к нему идут под блокировкой
+_lock = threading.Lock()
+_connection = None
+
+def get_connection():
+    """Открывает базу подписок при первом обращении. Вызывается под _lock."""
+    global _connection
+
+    if _connection is None:
+        connection = sqlite3.connect(DATABASE_FILE, check_same_thread=False)
+        # WAL: запись не блокирует чтение и переживает аварийный перезапуск
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        for statement in SCHEMA:
+            connection.execute(statement)
+        connection.commit()
+        _connection = connection
+
+    return _connection
+
+def subscribe(chat_id, kind, key):
+    """Подписывает чат. Возвращает False, если подписка уже была."""
+    with _lock:
+        connection = get_connection()
+        cursor = connection.execute(
+            "INSERT OR IGNORE INTO subscriptions (chat_id, kind, key, created) VALUES (?, ?, ?, ?)",
+            (chat_id, kind, key, time.time())
+        )
+        connection.commit()
+        return cursor.rowcount > 0
+
+def unsubscribe(chat_id, kind=None, key=None):
+    """
+    Отменяет подписку чата на (kind, key), а без аргументов - все подписки.
+    Возвращает количество отмененных подписок.
+    """
+    with _lock:
+        connection = get_connection()
+        if kind is None:
+            cursor = connection.execute("DELETE FROM subscriptions WHERE chat_id = ?", (chat_id,))
+        else:
+            cursor = connection.execute(
+                "DELETE FROM subscriptions WHERE chat_id = ? AND kind = ? AND key = ?",
+                (chat_id, kind, key)
+            )
+        connection.commit()
+        return cursor.rowcount
+
+def get_chat_subscriptions(chat_id):
+    """Подписки чата в порядке оформления: список (вид, ключ)"""
+    with _lock:
+        cursor = get_connection().execute(
+            "SELECT kind, key FROM subscriptions WHERE chat_id = ? ORDER BY created",
+            (chat_id,)
+        )
+        return cursor.fetchall()
+
+def get_subscribers_for(targets):
+    """
+    Подписчики сразу для многих целей (вид, ключ).
+    Возвращает словарь {chat_id: [(вид, ключ), ...]} - только затронутые чаты.
+    """
+    chat_targets = {}
+
+    with _lock:
+        connection = get_connection()
+        for kind, key in targets:
+            cursor = connection.execute(
+                "SELECT chat_id FROM subscriptions WHERE kind = ? AND key = ?",
+                (kind, key)
+            )
+            for chat_id, in cursor:
+                chat_targets.setdefault(chat_id, []).append((kind, key))
+
+    return chat_targets
+
+def count_subscriptions():
+    """Количество чатов с подписками и общее количество подписок"""
+    with _lock:
+        cursor = get_connection().execute(
+            "SELECT COUNT(DISTINCT chat_id), COUNT(*) FROM subscriptions"
+        )
+        return cursor.fetchone()
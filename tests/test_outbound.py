@@ -0,0 +1,141 @@
+import time
+import asyncio
+import importlib
+import threading
+
+import pytest
+
+import outbound
+
+class FakeTelegramError(Exception):
+    """Ошибка как у pyTelegramBotAPI: error_code и result_json"""
+    def __init__(self, error_code, retry_after=None):
+        super().__init__(f"Error code: {error_code}")
+        self.error_code = error_code
+        self.result_json = {'parameters': {'retry_after': retry_after}} if retry_after is not None else {}
+
+@pytest.fixture
+def dispatcher():
+    # Свежее состояние диспетчера и быстрые лимиты, чтобы тесты шли доли секунды
+    module = importlib.reload(outbound)
+    module.CHAT_RATE = 10
+    module.CHAT_BURST = 2
+    module.RETRY_DELAY = 0.05
+    return module
+
+def create_fake_send(fail=None):
+    """
+    Поддельный метод Bot API: записывает (время, chat_id, text).
+    fail(chat_id, text, attempt) может вернуть исключение для этой попытки.
+    """
+    sent = []
+    attempts = {}
+    lock = threading.Lock()
+    started = time.monotonic()
+    
+    def send(method, chat_id=None, text=None, **params):
+        with lock:
+            attempt = attempts[(chat_id, text)] = attempts.get((chat_id, text), 0) + 1
+        error = fail(chat_id, text, attempt) if fail else None
+        if error is not None:
+            raise error
+        with lock:
+            sent.append((time.monotonic() - started, chat_id, text))
+    
+    return send, sent
+
+def wait_for_sent(module, count, timeout=5):
+    deadline = time.monotonic() + timeout
+    while module.get_outbound_stats()['sent'] < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return module.get_outbound_stats()
+
+def test_keeps_chat_order_and_coalesces_duplicates(dispatcher):
+    send, sent = create_fake_send()
+    for text in ('a', 'b', 'b', 'c'):
+        dispatcher.enqueue(1, text)
+    dispatcher.enqueue(2, 'x')
+    dispatcher.start_outbound(send, workers=3)
+    
+    stats = wait_for_sent(dispatcher, 4)
+    
+    assert [text for _, chat_id, text in sent if chat_id == 1] == ['a', 'b', 'c']
+    assert stats['coalesced'] == 1
+    assert stats['queued'] == 0 and stats['chats'] == 0
+
+def test_chat_limit_spaces_messages(dispatcher):
+    send, sent = create_fake_send()
+    for text in ('1', '2', '3', '4'):
+        dispatcher.enqueue(1, text)
+    dispatcher.start_outbound(send, workers=2)
+    
+    wait_for_sent(dispatcher, 4)
+    times = [moment for moment, _, _ in sent]
+    
+    # Два сообщения сразу (burst), дальше - по одному в 1/CHAT_RATE секунды
+    assert times[1] < 0.05
+    assert times[2] >= 0.08
+    assert times[3] - times[2] >= 0.08
+
+def test_retry_after_delays_only_that_chat(dispatcher):
+    def fail(chat_id, text, attempt):
+        if text == 'a' and attempt == 1:
+            return FakeTelegramError(429, retry_after=0.3)
+    
+    send, sent = create_fake_send(fail)
+    dispatcher.enqueue(1, 'a')
+    dispatcher.enqueue(1, 'b')
+    dispatcher.enqueue(2, 'x')
+    dispatcher.start_outbound(send, workers=2)
+    
+    stats = wait_for_sent(dispatcher, 3)
+    
+    assert [text for _, chat_id, text in sent if chat_id == 1] == ['a', 'b']
+    assert sent[0][1] == 2
+    assert [moment for moment, chat_id, text in sent if text == 'a'][0] >= 0.3
+    assert stats['rate_limited'] == 1 and stats['failed'] == 0
+
+def test_gives_up_on_api_errors(dispatcher):
+    send, sent = create_fake_send(lambda chat_id, text, attempt: FakeTelegramError(403) if text == 'a' else None)
+    dispatcher.enqueue(1, 'a')
+    dispatcher.enqueue(1, 'b')
+    dispatcher.start_outbound(send, workers=1)
+    
+    wait_for_sent(dispatcher, 1)
+    time.sleep(0.05)
+    
+    assert [text for _, _, text in sent] == ['b']
+    assert dispatcher.get_outbound_stats()['failed'] == 1
+
+def test_async_dispatcher_keeps_order_and_retries(dispatcher):
+    sent = []
+    attempts = {}
+    
+    async def send(method, chat_id=None, text=None, **params):
+        attempts[text] = attempts.get(text, 0) + 1
+        if text == 'a' and attempts[text] == 1:
+            raise FakeTelegramError(429, retry_after=0.2)
+        # Медленный ответ сервера не должен задерживать другие чаты
+        await asyncio.sleep(0.1 if chat_id == 1 else 0)
+        sent.append((chat_id, text))
+    
+    async def run():
+        dispatcher.start_outbound_async(send)
+        
+        def producer():
+            dispatcher.enqueue(1, 'a')
+            dispatcher.enqueue(1, 'b')
+            for chat_id in range(2, 12):
+                dispatcher.enqueue(chat_id, 'x')
+        
+        await asyncio.get_running_loop().run_in_executor(None, producer)
+        deadline = time.monotonic() + 5
+        while len(sent) < 12 and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+    
+    asyncio.run(run())
+    
+    assert [text for chat_id, text in sent if chat_id == 1] == ['a', 'b']
+    assert sent[-2:] == [(1, 'a'), (1, 'b')]
+    stats = dispatcher.get_outbound_stats()
+    assert stats['sent'] == 12 and stats['rate_limited'] == 1 and stats['chats'] == 0
@@ -0,0 +1,97 @@
+import os
+import csv
+
+import pytest
+
+import download_schedule
+import schedule_parser
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+SHEET_FILE = os.path.join(FIXTURES_DIR, 'sheet001.htm')
+CSV_FILE = os.path.join(FIXTURES_DIR, 'school_schedule.csv')
+
+def read_fixture_csv():
+    with open(CSV_FILE, encoding='utf-8', newline='') as f:
+        return [row for row in csv.reader(f)]
+
+def read_sheet_rows(extractor):
+    with open(SHEET_FILE, 'rb') as f:
+        if extractor == 'bs4':
+            rows = download_schedule.iter_table_rows_bs4(
+                f.read().decode(download_schedule.SCHEDULE_ENCODING))
+        else:
+            rows = download_schedule.iter_table_rows_lxml(f)
+        return [row for row in download_schedule.expand_table_spans(rows) if row]
+
+def lesson_fields(lessons):
+    return [(lesson['time'], lesson['subject'], lesson['teacher'], lesson['classroom']) for lesson in lessons]
+
+def test_expand_table_spans_keeps_columns():
+    rows = [
+        [('a', 2, 1), ('b', 1, 3), ('c', 1, 1)],
+        [('d', 1, 1), ('e', 1, 1), ('f', 1, 1)],
+        [('g', 2, 1), ('h', 1, 1)],
+    ]
+    assert list(download_schedule.expand_table_spans(rows)) == [
+        ['a', '', 'b', 'c'],
+        ['d', 'e', '', 'f'],
+        ['g', '', '', 'h'],
+    ]
+
+@pytest.mark.parametrize('extractor', [
+    'bs4',
+    pytest.param('lxml', marks=pytest.mark.skipif(not download_schedule.LXML_AVAILABLE, reason='нет lxml')),
+])
+def test_sheet_converts_to_fixture_csv(extractor):
+    assert read_sheet_rows(extractor) == read_fixture_csv()
+
+def compile_fixture():
+    with open(CSV_FILE, encoding='utf-8', newline='') as f:
+        return schedule_parser.compile_timetable(schedule_parser.parse_schedule_rows(f.read()))
+
+def test_compile_reads_lesson_fields_by_position():
+    timetable = compile_fixture()
+    
+    assert timetable['classes'] == ('5 В', '5А', '5Б', '10А', '10Б', '10Е')
+    
+    # Пустой предмет не сдвигает учителя и кабинет
+    assert lesson_fields(timetable['class_days']['5А']['ПОНЕДЕЛЬНИК']) == [
+        ('8:00–8:40', 'Математика', 'Протасова', '214'),
+        ('8:50–9:30', 'Физкультура', 'Сидоров', 'спортзал'),
+        ('9:45–10:25', '', 'Кузнецова', '101'),
+    ]
+    # Объединенные ячейки: текст только в левом верхнем столбце
+    assert lesson_fields(timetable['class_days']['5Б']['ПОНЕДЕЛЬНИК']) == [
+        ('8:00–8:40', 'Русский язык', 'Иванова/Петров', '215'),
+        ('8:50–9:30', '', 'Сидоров', ''),
+        ('9:45–10:25', 'дистант', '', ''),
+    ]
+    # У класса нет первого урока - он начинается со второго
+    assert lesson_fields(timetable['class_days']['5В']['ПОНЕДЕЛЬНИК']) == [
+        ('8:50–9:30', 'История', 'Прокопьев', '302'),
+        ('9:45–10:25', 'Химия', 'Смирнова', '305'),
+    ]
+    assert lesson_fields(timetable['class_days']['10Б']['ВТОРНИК']) == [
+        ('8:00–8:40', 'Английский, группа', 'Иванова/Петров', '102'),
+        ('8:50–9:30', '', 'Смирнова', '101'),
+    ]
+    
+    first_lesson = timetable['class_days']['10А']['ВТОРНИК'][0]
+    assert first_lesson['teachers'] == ('Попов', 'Орлова')
+
+def test_lesson_numbers_come_from_sheet():
+    timetable = compile_fixture()
+    
+    # 5 В начинает понедельник со второго урока
+    assert [lesson['period'] for lesson in timetable['class_days']['5В']['ПОНЕДЕЛЬНИК']] == [2, 3]
+    
+    teacher_index, room_index, room_occupancy = schedule_parser.create_schedule_indexes(timetable)
+    monday = room_occupancy['days']['ПОНЕДЕЛЬНИК']
+    
+    assert monday[1] == (((480, 520),), frozenset({'214', '215'}))
+    assert monday[2] == (((530, 570),), frozenset({'спортзал', '302'}))
+    
+    # Свободными предлагаются только номерные кабинеты
+    assert room_occupancy['rooms'] == ('101', '102', '214', '215', '302', '305')
+    free = schedule_parser.get_free_rooms(0, 2, {'room_occupancy': room_occupancy})['free']
+    assert free == ['101', '102', '214', '215', '305']
@@ -0,0 +1,62 @@
+import pytest
+
+import subscriptions
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # Отдельная база на каждый тест
+    monkeypatch.setattr(subscriptions, 'DATABASE_FILE', str(tmp_path / 'subscriptions.db'))
+    monkeypatch.setattr(subscriptions, '_connection', None)
+    yield subscriptions
+    if subscriptions._connection is not None:
+        subscriptions._connection.close()
+
+def reconnect(store):
+    """Закрывает соединение, как при перезапуске бота"""
+    store._connection.close()
+    store._connection = None
+
+def test_subscribe_is_idempotent(store):
+    assert store.subscribe(1, store.KIND_CLASS, '5А')
+    assert not store.subscribe(1, store.KIND_CLASS, '5А')
+    assert store.subscribe(1, store.KIND_TEACHER, 'Протасова')
+    
+    assert store.get_chat_subscriptions(1) == [(store.KIND_CLASS, '5А'), (store.KIND_TEACHER, 'Протасова')]
+    assert store.count_subscriptions() == (1, 2)
+
+def test_unsubscribe_one_or_all(store):
+    store.subscribe(1, store.KIND_CLASS, '5А')
+    store.subscribe(1, store.KIND_CLASS, '5Б')
+    store.subscribe(1, store.KIND_TEACHER, 'Протасова')
+    
+    assert store.unsubscribe(1, store.KIND_CLASS, '5А') == 1
+    assert store.unsubscribe(1, store.KIND_CLASS, '5А') == 0
+    assert store.get_chat_subscriptions(1) == [(store.KIND_CLASS, '5Б'), (store.KIND_TEACHER, 'Протасова')]
+    
+    assert store.unsubscribe(1) == 2
+    assert store.get_chat_subscriptions(1) == []
+
+def test_subscribers_for_targets(store):
+    store.subscribe(1, store.KIND_CLASS, '5А')
+    store.subscribe(1, store.KIND_TEACHER, 'Протасова')
+    store.subscribe(2, store.KIND_TEACHER, 'Протасова')
+    store.subscribe(3, store.KIND_CLASS, '7Б')
+    
+    chat_targets = store.get_subscribers_for([(store.KIND_CLASS, '5А'), (store.KIND_TEACHER, 'Протасова')])
+    
+    # Только затронутые чаты, у каждого - все его затронутые подписки
+    assert chat_targets == {
+        1: [(store.KIND_CLASS, '5А'), (store.KIND_TEACHER, 'Протасова')],
+        2: [(store.KIND_TEACHER, 'Протасова')],
+    }
+    assert store.get_subscribers_for([(store.KIND_CLASS, '9Я')]) == {}
+
+def test_subscriptions_survive_reconnect(store):
+    store.subscribe(1, store.KIND_CLASS, '5А')
+    store.subscribe(-100, store.KIND_TEACHER, 'Протасова')
+    
+    reconnect(store)
+    
+    assert store.get_chat_subscriptions(1) == [(store.KIND_CLASS, '5А')]
+    assert store.get_subscribers_for([(store.KIND_TEACHER, 'Протасова')]) == {-100: [(store.KIND_TEACHER, 'Протасова')]}
+    assert not store.subscribe(1, store.KIND_CLASS, '5А')
@@ -0,0 +1,87 @@
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Заголовок, в котором Telegram передает секрет, указанный при setWebhook
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+# Ограничение на размер одного обновления (байт)
+MAX_UPDATE_SIZE = 1024 * 1024
+
+def create_webhook_handler(path, handle_update, secret_token=None):
+    """
+    Создает класс обработчика HTTP-запросов для вебхука.
+    handle_update(data) получает разобранный JSON обновления и должен
+    быстро вернуть управление (например, положить обновление в очередь).
+    """
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def send_text(self, status, text=''):
+            body = text.encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/plain; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            # Проверка работоспособности для хостинга
+            self.send_text(200, 'ok')
+
+        def do_POST(self):
+            if self.path != path:
+                self.send_text(404)
+                return
+
+            if secret_token and self.headers.get(SECRET_HEADER) != secret_token:
+                self.send_text(403)
+                return
+
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+            except ValueError:
+                length = -1
+            if length <= 0 or length > MAX_UPDATE_SIZE:
+                self.send_text(400)
+                return
+
+            try:
+                data = json.loads(self.rfile.read(length).decode('utf-8'))
+            except ValueError:
+                self.send_text(400)
+                return
+
+            try:
+                handle_update(data)
+            except Exception as e:
+                # Telegram повторяет доставку при ошибке - это не поможет,
+                # поэтому ошибку только записываем в лог
+                logger.error(f"❌ Ошибка приема обновления: {e}")
+
+            # Отвечаем сразу, обработка идет в фоне
+            self.send_text(200)
+
+        def log_message(self, format, *args):
+            logger.debug("webhook: " + format, *args)
+
+    return WebhookHandler
+
+def start_webhook_server(port, path, handle_update, secret_token=None, host='0.0.0.0'):
+    """
+    Запускает HTTP-сервер вебхука в фоновом потоке.
+    Возвращает сервер (для остановки - server.shutdown()).
+    """
+    handler = create_webhook_handler(path, handle_update, secret_token)
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+
+    threading.Thread(
+        target=server.serve_forever,
+        name='webhook-server',
+        daemon=True
+    ).start()
+
+    logger.info(f"🌐 Вебхук слушает {host}:{port}{path}")
+    return server